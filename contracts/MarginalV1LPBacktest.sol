@@ -9,6 +9,8 @@ import {LiquidityMath} from "@marginal/v1-core/contracts/libraries/LiquidityMath
 
 import {Backtest} from "@smolquants/backtest-ape/contracts/Backtest.sol";
 
+import {MockERC20} from "./mocks/MockERC20.sol";
+
 /// @title Marginal V1 Liquidity Provider Backtester
 /// @notice Backtests a hypothetical LP position on Marginal V1
 contract MarginalV1LPBacktest is Backtest {
@@ -18,6 +20,21 @@ contract MarginalV1LPBacktest is Backtest {
         pool = _pool;
     }
 
+    /// @notice Mints near infinite tokens to this contract, the Uniswap v3 pool and account, then approves spender for
+    /// tokens held
+    /// @param tokens The mock tokens to setup
+    /// @param univ3Pool The mock Uniswap v3 pool to mint tokens to so swaps work
+    /// @param account The account to mint tokens to so positions can be taken out
+    /// @param spender The spender to approve for tokens held by this contract
+    function setupTokens(address[] calldata tokens, address univ3Pool, address account, address spender) external {
+        for (uint256 i = 0; i < tokens.length; i++) {
+            MockERC20(tokens[i]).mint(address(this), type(uint128).max);
+            MockERC20(tokens[i]).mint(univ3Pool, type(uint128).max);
+            MockERC20(tokens[i]).mint(account, type(uint128).max);
+            MockERC20(tokens[i]).approve(spender, type(uint256).max);
+        }
+    }
+
     /// @notice The LP shares held by this contract for pool
     function sharesLp() public view returns (uint256) {
         return IERC20(pool).balanceOf(address(this));
@@ -1,4 +1,5 @@
 import click
+import json
 import os
 import marginal_simulations_2024_02
 
@@ -7,6 +8,20 @@ from ape import networks
 from typing_inspect import get_origin
 
 
+# prompt schema of runner fields (name => (type, type origin, default)) for each runner type
+FIELD_SCHEMAS = {
+    runner_cls_name: {
+        name: (
+            field.annotation if get_origin(field.annotation) is None else str,  # default to str if not base type
+            get_origin(field.annotation),
+            field.default,
+        )
+        for name, field in getattr(marginal_simulations_2024_02, runner_cls_name).__fields__.items()
+    }
+    for runner_cls_name in marginal_simulations_2024_02.__all__
+}
+
+
 def main():
     """
     Main backtester script.
@@ -23,29 +38,66 @@ def main():
         raise ValueError("not connected to mainnet-fork.")
 
     # prompt user which backtest runner to use
-    runner_cls_name = click.prompt(
-        "Runner type", type=click.Choice(marginal_simulations_2024_02.__all__, case_sensitive=False)
+    runner_cls_name = env_or_prompt(
+        "RUNNER_TYPE",
+        "Runner type",
+        type=click.Choice(marginal_simulations_2024_02.__all__, case_sensitive=False),
     )
     runner_cls = getattr(marginal_simulations_2024_02, runner_cls_name)
 
-    # prompt user for fields on runner to init with
+    # skip prompts for fields on runner if kwargs given as json in env
+    kwargs_json = os.environ.get("RUNNER_KWARGS_JSON")
+    kwargs = json.loads(kwargs_json) if kwargs_json is not None else prompt_runner_kwargs(runner_cls_name)
+
+    # setup runner
+    runner = runner_cls(**kwargs)
+    click.echo(f"Runner instance: {runner}")
+
+    # run backtest
+    univ3_pool_addr = runner._refs["univ3_pool"].address
+    start = env_or_prompt("BACKTEST_START", "Start block number", type=int)
+    stop = env_or_prompt("BACKTEST_STOP", "Stop block number", type=int, default=-1)
+    step = env_or_prompt("BACKTEST_STEP", "Step size", type=int, default=1)
+
+    # file at path overwritten if already exists
+    path = f"notebook/results/{runner_cls_name}_{univ3_pool_addr}_{runner.maintenance}_{runner.utilization}_{runner.skew}_{runner.leverage}_{runner.rel_margin_above_safe_min}_{runner.blocks_held}_{runner.sqrt_price_tol}_{start}_{stop}_{step}.csv"
+
+    if stop < 0:
+        stop = None
+
+    args = [path, start, stop, step]
+    runner.backtest(*args)
+
+
+def env_or_prompt(env_name: str, text: str, **kwargs):
+    """
+    Gets the value from the environment variable if set, otherwise prompts user for it.
+    """
+    value = os.environ.get(env_name)
+    if value is None:
+        return click.prompt(text, **kwargs)
+
+    click.echo(f"{text} ({env_name}): {value}")
+    return click.types.convert_type(kwargs.get("type"))(value)
+
+
+def prompt_runner_kwargs(runner_cls_name: str) -> dict:
+    """
+    Prompts user for fields on runner to init with.
+    """
     skip_names = ["leverage", "rel_margin_above_safe_min"]
     kwargs = {}
-    for name, field in runner_cls.__fields__.items():
+    for name, (type_, type_origin, default) in FIELD_SCHEMAS[runner_cls_name].items():
         if name in skip_names:
             continue
 
-        # default to str if not base type
-        type_origin = get_origin(field.annotation)
-        type_ = field.annotation if type_origin is None else str
-
         # confirm prompt if Optional
-        if field.default is None:
+        if default is None:
             if not click.confirm(f"Runner kwarg ({name}) defaults to None. Do you want to input a value?"):
-                kwargs[name] = field.default
+                kwargs[name] = default
                 continue
 
-        value = click.prompt(f"Runner kwarg ({name})", default=field.default, type=type_)
+        value = click.prompt(f"Runner kwarg ({name})", default=default, type=type_)
 
         # parse field value from str if not base type
         if type_origin is not None:
@@ -59,24 +111,4 @@ def main():
         type=click.Choice(["leverage", "rel_margin_above_safe_min"], case_sensitive=False),
     )
     kwargs[lev_input] = click.prompt(f"{lev_input}", type=float)
-
-    # setup runner
-    runner = runner_cls(**kwargs)
-    click.echo(f"Runner instance: {runner}")
-
-    # run backtest
-    univ3_pool_addr = runner._refs["univ3_pool"].address
-    start = click.prompt("Start block number", type=int)
-    stop = click.prompt("Stop block number", type=int, default=-1)
-    step = click.prompt("Step size", type=int, default=1)
-
-    # remove file if already exists at path
-    path = f"notebook/results/{runner_cls_name}_{univ3_pool_addr}_{runner.maintenance}_{runner.utilization}_{runner.skew}_{runner.leverage}_{runner.rel_margin_above_safe_min}_{runner.blocks_held}_{runner.sqrt_price_tol}_{start}_{stop}_{step}.csv"
-    if os.path.exists(path):
-        os.remove(path)
-
-    if stop < 0:
-        stop = None
-
-    args = [path, start, stop, step]
-    runner.backtest(*args)
+    return kwargs
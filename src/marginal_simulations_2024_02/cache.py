@@ -0,0 +1,100 @@
+import json
+import os
+import sqlite3
+
+from typing import Any, List, Mapping
+
+
+def open_refs_cache(path: str) -> sqlite3.Connection:
+    """
+    Opens the on-disk cache of raw refs JSON-RPC results by block, creating it if needed.
+
+    Args:
+        path (str): The path to the sqlite database file.
+
+    Returns:
+        :class:`sqlite3.Connection`
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+
+    # rows cached before keying on chain ID may hold local fork blocks, so drop them
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(refs)")]
+    if len(columns) > 0 and "chain_id" not in columns:
+        conn.execute("DROP TABLE refs")
+
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS refs ("
+        "chain_id INTEGER, address TEXT, number INTEGER, seconds_ago INTEGER, results TEXT, "
+        "PRIMARY KEY (chain_id, address, number, seconds_ago))"
+    )
+    conn.commit()
+    return conn
+
+
+def get_cached_refs_results(
+    conn: sqlite3.Connection,
+    chain_id: int,
+    address: str,
+    numbers: List[int],
+    seconds_ago: int,
+    max_number: int,
+) -> Mapping[int, List[Any]]:
+    """
+    Gets the cached raw refs JSON-RPC results at the given blocks.
+
+    Blocks past the max number are never looked up, as they may be local to the fork.
+
+    Args:
+        conn (:class:`sqlite3.Connection`): The cache connection.
+        chain_id (int): The chain ID of the ref pool.
+        address (str): The ref pool address.
+        numbers (List[int]): The block numbers.
+        seconds_ago (int): The seconds ago used for oracle observations.
+        max_number (int): The max block number cached, final upstream of the fork.
+
+    Returns:
+        Mapping[int, List[Any]]: The raw results by block number for blocks in cache.
+    """
+    numbers = [number for number in numbers if number <= max_number]
+    if len(numbers) == 0:
+        return {}
+
+    rows = conn.execute(
+        f"SELECT number, results FROM refs WHERE chain_id = ? AND address = ? AND seconds_ago = ? "
+        f"AND number IN ({', '.join('?' * len(numbers))})",
+        [chain_id, address, seconds_ago, *numbers],
+    ).fetchall()
+    return {number: json.loads(results) for number, results in rows}
+
+
+def set_cached_refs_results(
+    conn: sqlite3.Connection,
+    chain_id: int,
+    address: str,
+    results: Mapping[int, List[Any]],
+    seconds_ago: int,
+    max_number: int,
+):
+    """
+    Stores the raw refs JSON-RPC results by block in the cache.
+
+    Blocks past the max number are skipped, as they may be local to the fork.
+
+    Args:
+        conn (:class:`sqlite3.Connection`): The cache connection.
+        chain_id (int): The chain ID of the ref pool.
+        address (str): The ref pool address.
+        results (Mapping[int, List[Any]]): The raw results by block number.
+        seconds_ago (int): The seconds ago used for oracle observations.
+        max_number (int): The max block number cached, final upstream of the fork.
+    """
+    conn.executemany(
+        "INSERT OR REPLACE INTO refs VALUES (?, ?, ?, ?, ?)",
+        [
+            (chain_id, address, number, seconds_ago, json.dumps(res))
+            for number, res in results.items()
+            if number <= max_number
+        ],
+    )
+    conn.commit()
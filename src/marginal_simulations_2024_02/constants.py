@@ -2,3 +2,12 @@
 FEE_UNIT = 1000000
 MAINTENANCE_UNIT = 1000000
 MINIMUM_LIQUIDITY = 10000
+
+# univ3
+MIN_TICK = -887272
+MAX_TICK = 887272
+
+# evm
+MAX_UINT128 = (1 << 128) - 1
+MAX_UINT256 = (1 << 256) - 1
+MAX_INT256 = (1 << 255) - 1
@@ -0,0 +1,157 @@
+import json
+import threading
+
+from typing import Any, Dict, List, Tuple, Union
+
+import requests
+from ape import chain
+from ape.contracts import ContractInstance
+from ape.exceptions import ApeException, ProviderError
+from eth_abi import encode
+from eth_utils import keccak, to_hex
+from ethpm_types.abi import MethodABI
+from hexbytes import HexBytes
+from web3 import HTTPProvider
+
+
+RPC_BATCH_SIZE = 20  # max number of requests sent in a single JSON-RPC batch
+RPC_TIMEOUT = 60  # seconds to wait on the provider for a batch response before raising
+
+_method_templates: Dict[str, Tuple[bytes, List[str]]] = {}  # method selector and input types by signature
+_local = threading.local()  # per thread session reusing the connection to the provider across batches
+
+
+def get_session() -> requests.Session:
+    """
+    Gets the requests session for the current thread, creating it if needed.
+
+    Returns:
+        :class:`requests.Session`
+    """
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def encode_calldata(abi: MethodABI, *args) -> bytes:
+    """
+    Encodes calldata for a call to the method, caching the method selector
+    and abi input types by signature on first encode.
+
+    Args are encoded directly with eth-abi, skipping ape arg conversion,
+    so struct args must be given as tuples and addresses as str.
+
+    Returns:
+        bytes: The encoded calldata.
+    """
+    if abi.selector not in _method_templates:
+        _method_templates[abi.selector] = (
+            keccak(text=abi.selector)[:4],
+            [abi_input.canonical_type for abi_input in abi.inputs],
+        )
+
+    selector, types = _method_templates[abi.selector]
+    return selector + encode(types, args)
+
+
+def get_eth_call_request(
+    contract: ContractInstance,
+    abi: MethodABI,
+    *args,
+    block_identifier: Union[int, str],
+) -> Tuple[str, List]:
+    """
+    Gets the JSON-RPC method and params for an eth_call to the contract at the given block,
+    either a block number or tag like "latest".
+
+    Returns:
+        Tuple[str, List]: The JSON-RPC method and params.
+    """
+    data = encode_calldata(abi, *args)
+    block = hex(block_identifier) if isinstance(block_identifier, int) else block_identifier
+    return ("eth_call", [{"to": contract.address, "data": to_hex(data)}, block])
+
+
+def decode_eth_call_response(abi: MethodABI, result: str) -> Any:
+    """
+    Decodes the raw result of an eth_call, unpacking single outputs as ape contract calls do.
+
+    Returns:
+        Any: The decoded return data.
+    """
+    ecosystem = chain.provider.network.ecosystem
+    output = ecosystem.decode_returndata(abi, HexBytes(result))
+    if not isinstance(output, (list, tuple)):
+        return output
+    elif len(output) < 2:
+        return output[0] if len(output) == 1 else None
+
+    return output
+
+
+def make_batch_request(calls: List[Tuple[str, List]], batch_size: int = RPC_BATCH_SIZE) -> List[Any]:
+    """
+    Sends JSON-RPC requests to the connected provider in batches of at most batch_size.
+    Raises if the provider rejects a batch outright or leaves any request in it unanswered.
+
+    Falls back to one request per call through the ape provider if not connected over HTTP,
+    as batches are posted directly to the provider endpoint.
+
+    Args:
+        calls (List[Tuple[str, List]]): The JSON-RPC method and params of each request.
+        batch_size (int): The max number of requests per batch.
+
+    Returns:
+        List[Any]: The results in the order requested. Requests that errored
+            return :class:`ape.exceptions.ProviderError` instead of raising.
+    """
+    web3_provider = chain.provider.web3.provider
+    if not isinstance(web3_provider, HTTPProvider):
+        return [make_request(method, params) for method, params in calls]
+
+    uri = web3_provider.endpoint_uri
+    session = get_session()
+    results = []
+    for i in range(0, len(calls), batch_size):
+        payload = [
+            {"jsonrpc": "2.0", "id": j, "method": method, "params": params}
+            for j, (method, params) in enumerate(calls[i : i + batch_size])
+        ]
+        response = session.post(
+            uri,
+            data=json.dumps(payload, separators=(",", ":")),
+            headers={"Content-Type": "application/json"},
+            timeout=RPC_TIMEOUT,
+        )
+        response.raise_for_status()
+
+        # node returns a single error object instead of a list if it rejects the batch as a whole
+        body = json.loads(response.content)
+        if not isinstance(body, list):
+            error = body.get("error") if isinstance(body, dict) else None
+            message = error.get("message", "") if isinstance(error, dict) else str(body)
+            raise ProviderError(f"Batch request failed: {message}")
+
+        # responses in a batch are not guaranteed to be ordered
+        responses = {res.get("id"): res for res in body if isinstance(res, dict)}
+        for j in range(len(payload)):
+            if j not in responses:
+                raise ProviderError(f"Batch response missing result for request id {j}.")
+
+            res = responses[j]
+            results.append(ProviderError(res["error"].get("message", "")) if "error" in res else res["result"])
+
+    return results
+
+
+def make_request(method: str, params: List) -> Any:
+    """
+    Sends a single JSON-RPC request through the connected ape provider.
+
+    Returns:
+        Any: The result. Errors return :class:`ape.exceptions.ProviderError` instead of raising.
+    """
+    try:
+        return chain.provider._make_request(method, params)
+    except ApeException as err:
+        return err if isinstance(err, ProviderError) else ProviderError(str(err))
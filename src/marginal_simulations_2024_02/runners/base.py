@@ -1,7 +1,15 @@
-from typing import Any, ClassVar, List
+import json
+import os
+import tempfile
+
+from functools import lru_cache
+from typing import Any, ClassVar, Dict, List, Mapping, Tuple
 
 import click
-from ape import Contract
+from ape import Contract, chain
+from ape.contracts import ContractInstance
+from ape.exceptions import UnknownSnapshotError
+from ape.types import SnapshotID
 
 from backtest_ape.base import BaseRunner
 from backtest_ape.setup import deploy_mock_erc20
@@ -19,10 +27,26 @@ from marginal_simulations_2024_02.runners.setup import (
 )
 
 
+@lru_cache(maxsize=256)
+def get_contract(address: str) -> ContractInstance:
+    """
+    Gets the ape Contract instance at the given address, memoized across
+    runners as contract instances aren't tied to a block.
+
+    Returns:
+        :class:`ape.contracts.ContractInstance`
+    """
+    return Contract(address)
+
+
 class BaseMarginalV1Runner(BaseRunner):
     maintenance: int = 250000  # min maintenance of the Marginal pool used in backtests
 
     _ref_keys: ClassVar[List[str]] = ["WETH9", "univ3_pool", "univ3_static_quoter"]
+    _metadata_cache_path: ClassVar[str] = "notebook/results/.metadata_cache.json"
+    _mocks_snapshots: ClassVar[Dict[Tuple, Tuple[SnapshotID, Mapping]]] = {}  # chain snapshots after mocks deployed
+
+    _refs_metadata: Mapping = {}  # immutable metadata of ref univ3 pool and its tokens
 
     def __init__(self, **data: Any):
         """
@@ -32,8 +56,50 @@ class BaseMarginalV1Runner(BaseRunner):
         super().__init__(**data)
 
         # store token contracts in _refs
+        self._refs_metadata = self.get_refs_metadata()
+        self._refs["tokens"] = [get_contract(token_addr) for token_addr in self._refs_metadata["tokens"]]
+
+    def get_refs_metadata(self) -> Mapping:
+        """
+        Gets the immutable metadata of the reference Uniswap V3 pool and its tokens.
+        Cached on disk by chain ID and pool address to avoid refetching across runs.
+
+        Returns:
+            Mapping: The token addresses, fee, token symbols and token decimals.
+        """
         univ3_pool = self._refs["univ3_pool"]
-        self._refs["tokens"] = [Contract(univ3_pool.token0()), Contract(univ3_pool.token1())]
+        key = f"{chain.chain_id}:{univ3_pool.address}"
+
+        # unreadable cache treated as a miss and rewritten below
+        cache = {}
+        try:
+            with open(self._metadata_cache_path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        if key not in cache:
+            tokens = [get_contract(univ3_pool.token0()), get_contract(univ3_pool.token1())]
+            cache[key] = {
+                "tokens": [token.address for token in tokens],
+                "fee": univ3_pool.fee(),
+                "symbols": [token.symbol() for token in tokens],
+                "decimals": [token.decimals() for token in tokens],
+            }
+
+            # write to temp file then swap in so concurrent runners never read a partial file
+            dirname, basename = os.path.split(self._metadata_cache_path)
+            os.makedirs(dirname, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=f"{basename}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(cache, f, indent=2)
+                os.replace(tmp_path, self._metadata_cache_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+        return cache[key]
 
     def setup(self, mocking: bool = True):
         """
@@ -49,17 +115,32 @@ class BaseMarginalV1Runner(BaseRunner):
     def deploy_mocks(self):
         """
         Deploys the mock contracts.
+
+        Restores the chain to a snapshot taken right after a previous deploy
+        of the same mocks in this session instead of redeploying, if available.
         """
+        key = (chain.chain_id, self._refs["univ3_pool"].address, self.maintenance, self.acc.address)
+        if key in self._mocks_snapshots:
+            snapshot_id, mocks = self._mocks_snapshots[key]
+            try:
+                click.echo(f"Restoring chain to snapshot {snapshot_id} with mocks already deployed ...")
+                chain.restore(snapshot_id)
+                self._mocks = dict(mocks)
+                self._mocks_snapshots[key] = (chain.snapshot(), mocks)
+                return
+            except UnknownSnapshotError:
+                del self._mocks_snapshots[key]
+
         # deploy the mock erc20s
         click.echo("Deploying mock ERC20 tokens ...")
+        metadata = self._refs_metadata
         mock_tokens = [
-            deploy_mock_erc20(f"Mock Token{i}", token.symbol(), token.decimals(), self.acc)
-            for i, token in enumerate(self._refs["tokens"])
+            deploy_mock_erc20(f"Mock Token{i}", symbol, decimals, self.acc)
+            for i, (symbol, decimals) in enumerate(zip(metadata["symbols"], metadata["decimals"]))
         ]
 
         # deploy the mock univ3 factory and pool
-        ref_univ3_pool = self._refs["univ3_pool"]
-        fee = ref_univ3_pool.fee()
+        fee = metadata["fee"]
         mock_univ3_factory = deploy_mock_univ3_factory(self.acc)
         mock_univ3_pool = create_mock_univ3_pool(mock_univ3_factory, mock_tokens, fee, self.acc)
 
@@ -97,3 +178,6 @@ class BaseMarginalV1Runner(BaseRunner):
             "mrglv1_quoter": mock_quoter,
             "mrglv1_arbitrageur": mock_arbitrageur,
         }
+
+        # snapshot to restore from on subsequent deploys with same mocks
+        self._mocks_snapshots[key] = (chain.snapshot(), self._mocks)
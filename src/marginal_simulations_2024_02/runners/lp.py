@@ -1,22 +1,46 @@
 import click
-import os
-import pandas as pd
+import csv
+import sqlite3
+import threading
 
-from typing import ClassVar, List, Mapping, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, ClassVar, Dict, List, Mapping, Optional, TextIO, Tuple
 
 from ape import chain
+from ape.contracts import ContractInstance
 from ape.exceptions import ProviderError
 from backtest_ape.utils import get_block_identifier
+from eth_abi import decode
+from eth_abi.packed import encode_packed
+from eth_utils import keccak
+from hexbytes import HexBytes
 from pydantic import validator
 
 from marginal_simulations_2024_02.runners.base import BaseMarginalV1Runner
-from marginal_simulations_2024_02.constants import FEE_UNIT, MINIMUM_LIQUIDITY
+from marginal_simulations_2024_02.constants import (
+    FEE_UNIT,
+    MAX_INT256,
+    MAX_UINT128,
+    MAX_UINT256,
+    MINIMUM_LIQUIDITY,
+)
 from marginal_simulations_2024_02.utils import (
     get_mrglv1_amounts_for_liquidity,
     get_mrglv1_liquidity_sqrt_price_x96_from_reserves,
     get_mrglv1_size_from_liquidity_delta,
     get_mrglv1_position_key,
 )
+from marginal_simulations_2024_02.cache import (
+    get_cached_refs_results,
+    open_refs_cache,
+    set_cached_refs_results,
+)
+from marginal_simulations_2024_02.rpc import (
+    decode_eth_call_response,
+    encode_calldata,
+    get_eth_call_request,
+    make_batch_request,
+)
 
 
 class MarginalV1LPRunner(BaseMarginalV1Runner):
@@ -27,12 +51,79 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
     rel_margin_above_safe_min: float = 0  # buffer above safe margin min if leverage not specified
     blocks_held: int = 7200  # average number of blocks positions held
     sqrt_price_tol: float = 0.0025  # sqrt price diff above which should arb pools
+    verbose: bool = True  # whether to echo strategy updates at each block
 
     _backtester_name: ClassVar[str] = "MarginalV1LPBacktest"
+    _prefetch_size: ClassVar[int] = 10  # number of blocks of refs state to fetch ahead per batch
+    _prefetch_workers: ClassVar[int] = 8  # number of batches fetched concurrently, bound by RPC rather than CPU
+
+    # refs state prefetched ahead of backtest loop
+    _prefetch_numbers: List[int] = []  # block numbers backtest iterates over
+    _prefetch_cursor: int = 0  # index in prefetch numbers of next block to fetch
+    _prefetch_executor: Optional[ThreadPoolExecutor] = None
+    _refs_states_prefetched: Dict[int, Future] = {}
+    _seconds_ago: int = -1  # seconds ago of the mock mrglv1 pool oracle
+    _mrglv1_fee: int = -1  # fee of the mock mrglv1 pool
+
+    # raw refs results cached on disk across backtests
+    _refs_cache_path: ClassVar[str] = "notebook/results/.refs_cache.sqlite"
+    _refs_cache_finality: ClassVar[int] = 64  # blocks below fork block before refs state cached, as could still reorg
+    _refs_cache: Optional[sqlite3.Connection] = None
+    _refs_cache_lock: ClassVar[threading.Lock] = threading.Lock()  # guards cache across prefetch workers
+    _chain_id: int = -1
+    _refs_cache_max_number: int = -1  # max block number refs state cached for, as blocks past fork are local
+
+    # results file streamed to through backtest or replay, opened on first record
+    _record_buffering: ClassVar[int] = 1 << 20  # bytes buffered before writing to results file
+    _record_flush_every: ClassVar[int] = 1000  # number of rows recorded between flushes
+    _record_file: Optional[TextIO] = None
+    _record_writer: Optional[csv.DictWriter] = None
+    _record_rows: int = 0
+    _record_row: Dict[str, Any] = {}  # row overwritten in place each record as fields fixed through backtest
+    _record_attr_keys: Dict[str, List[str]] = {}  # unfolded column names of list attrs recorded
+
+    # attrs recorded each block, unfolded into a column per index if list
+    _record_attr_names: ClassVar[List[str]] = [
+        "_token_ids",
+        "_blocks_settle",
+        "_sizes_outstanding",
+        "_margins_outstanding",
+        "_debts_outstanding",
+        "_debts_without_funding_outstanding",
+        "_funding_rates_outstanding",
+        "_amounts0_locked",
+        "_amounts1_locked",
+        "_positions_liquidated_cumulative",
+        "_positions_settled_cumulative",
+        "_sizes_liquidated_cumulative",
+        "_sizes_settled_cumulative",
+        "_net_liquidity_liquidated_cumulative",
+        "_net_liquidity_settled_cumulative",
+        "_balances_pool",
+        "_last_mrglv1_block_timestamp",
+        "_last_mrglv1_tick_cumulative",
+        "_net_liquidity_swap_fees_cumulative",
+        "_net_liquidity_position_fees_cumulative",
+    ]
+
+    _echo_lines: List[str] = []  # messages echoed while updating strategy, written out once per block
+
+    # addresses of refs, mocks and runner account resolved once on setup
+    _addrs: Dict[str, str] = {}
+
+    # abis of methods called on refs and mocks resolved once on setup by "contract.method"
+    _abis: Dict[str, Any] = {}
+    _slot0_fields: List[str] = []  # field names of mock univ3 pool slot0 struct
+    _swap_path: bytes = b""  # router path for swaps (1 => 0 => 1) through mock mrglv1 pool
+
+    # event topic, inputs by name (indexed, position, type), non-indexed input types and whether data is one word per
+    # non-indexed input by (contract address, event name)
+    _event_templates: Dict[Tuple[str, str], Tuple[bytes, Dict[str, Tuple[bool, int, str]], List[str], bool]] = {}
 
     # indices: [zeroForOne = True, zeroForOne = False]
     _token_ids: List[int] = [-1, -1]  # token IDs for outstanding positions on mrglv1 pool (only two of them)
     _blocks_settle: List[int] = [-1, -1]  # future blocks to settle positions at
+    _position_keys: List[Optional[bytes]] = [None, None]  # mrglv1 pool position keys for outstanding token IDs
 
     _sizes_outstanding: List[int] = [0, 0]
     _margins_outstanding: List[int] = [0, 0]
@@ -56,9 +147,11 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
     # indices: [token0, token1]
     _last_univ3_fee_growth_global_x128: List[int] = [-1, -1]
     _last_univ3_observation1: Tuple = (-1, -1, -1, -1)
+    _univ3_sqrt_price_x96: Optional[int] = None  # mock univ3 pool sqrt price as last set, until next arb
     _balances_pool: List[int] = [0, 0]
 
     # mrgl v1 mock pool state
+    _mrglv1_state: Optional[Any] = None  # cached until next tx changing mock pool state
     _last_mrglv1_block_timestamp: int = -1
     _last_mrglv1_tick_cumulative: int = -1
     _net_liquidity_swap_fees_cumulative: int = 0  # liquidity gained due to fees on swaps
@@ -109,7 +202,7 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
             b (int): The liquidity delta for the zeroForOne = false position
         """
         mock_mrglv1_pool = self._mocks["mrglv1_pool"]
-        liquidity = mock_mrglv1_pool.state().liquidity
+        liquidity = self.get_mrglv1_state().liquidity
         liquidity_locked = mock_mrglv1_pool.liquidityLocked()
         total_liquidity = liquidity + liquidity_locked
 
@@ -117,10 +210,55 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
         liquidity_delta_10 = int((total_liquidity * self.utilization * (1 - self.skew)) // 2)
         return (liquidity_delta_01, liquidity_delta_10)
 
-    def get_positions_values(self) -> (List[int], List[int], List[int], List[int], List[float]):
+    def get_positions(self) -> (List[Any], List[Any]):
+        """
+        Gets the outstanding positions on the manager and on the pool. Reads are sent in
+        two JSON-RPC batch requests, as pool position keys depend on manager positions.
+
+        Returns:
+            positions (List[Any]): Manager positions for [zeroForOne=true, zeroForOne=false]
+            ppositions (List[Any]): Pool positions for [zeroForOne=true, zeroForOne=false]
+        """
+        mock_mrglv1_manager = self._mocks["mrglv1_manager"]
+        mock_mrglv1_pool = self._mocks["mrglv1_pool"]
+
+        positions_abi = self._abis["mrglv1_manager.positions"]
+        results = make_batch_request(
+            [
+                get_eth_call_request(mock_mrglv1_manager, positions_abi, token_id, block_identifier="latest")
+                for token_id in self._token_ids
+            ]
+        )
+        for result in results:
+            if isinstance(result, ProviderError):
+                raise result
+
+        positions = [decode_eth_call_response(positions_abi, result) for result in results]
+
+        ppositions_abi = self._abis["mrglv1_pool.positions"]
+        results = make_batch_request(
+            [
+                get_eth_call_request(mock_mrglv1_pool, ppositions_abi, key, block_identifier="latest")
+                for key in self._position_keys
+            ]
+        )
+        for result in results:
+            if isinstance(result, ProviderError):
+                raise result
+
+        ppositions = [decode_eth_call_response(ppositions_abi, result) for result in results]
+        return (positions, ppositions)
+
+    def get_positions_values(
+        self, positions: List[Any], ppositions: List[Any]
+    ) -> (List[int], List[int], List[int], List[int], List[float]):
         """
         Gets the sizes, debts (with and without funding) and margins of the oustanding positions.
 
+        Args:
+            positions (List[Any]): Manager positions for [zeroForOne=true, zeroForOne=false]
+            ppositions (List[Any]): Pool positions for [zeroForOne=true, zeroForOne=false]
+
         Returns:
             sizes_outstanding (List[int]): Position sizes for [zeroForOne=true, zeroForOne=false]
             margins_outstanding (List[int]): Position margins for [zeroForOne=true, zeroForOne=false]
@@ -128,18 +266,12 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
             debts_without_funding_outstanding (List[int]): Position debts without funding (originally at open) for [zeroForOne=true, zeroForOne=false]
             funding_rates_outstanding (List[float]): Position funding rates owed since open for [zeroForOne=true, zeroForOne=false]
         """
-        mock_mrglv1_manager = self._mocks["mrglv1_manager"]
-        mock_mrglv1_pool = self._mocks["mrglv1_pool"]
-
         sizes_outstanding = [0, 0]
         margins_outstanding = [0, 0]
         debts_outstanding = [0, 0]
         debts_without_funding_outstanding = [0, 0]
         funding_rates_outstanding = [0.0, 0.0]
-        for i, token_id in enumerate(self._token_ids):
-            position = mock_mrglv1_manager.positions(token_id)
-            key = get_mrglv1_position_key(mock_mrglv1_manager.address, position.positionId)
-            pposition = mock_mrglv1_pool.positions(key)
+        for i, (position, pposition) in enumerate(zip(positions, ppositions)):
             sizes_outstanding[i] = position.size
             margins_outstanding[i] = position.margin
             debts_outstanding[i] = position.debt
@@ -154,23 +286,20 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
             funding_rates_outstanding,
         )
 
-    def get_positions_amounts_locked(self) -> (List[int], List[int]):
+    def get_positions_amounts_locked(self, ppositions: List[Any]) -> (List[int], List[int]):
         """
         Gets the amounts of token0 and token1 locked in outstanding positions.
 
+        Args:
+            ppositions (List[Any]): Pool positions for [zeroForOne=true, zeroForOne=false]
+
         Returns:
             amounts0_locked (List[int]): Amounts of token0 locked for [zeroForOne=true, zeroForOne=false]
             amount1_locked (List[int]): Amounts of token1 locked for [zeroForOne=true, zeroForOne=false]
         """
-        mock_mrglv1_manager = self._mocks["mrglv1_manager"]
-        mock_mrglv1_pool = self._mocks["mrglv1_pool"]
-
         amounts0_locked = [0, 0]
         amounts1_locked = [0, 0]
-        for i, token_id in enumerate(self._token_ids):
-            position = mock_mrglv1_manager.positions(token_id)
-            key = get_mrglv1_position_key(mock_mrglv1_manager.address, position.positionId)
-            pposition = mock_mrglv1_pool.positions(key)
+        for i, pposition in enumerate(ppositions):
             if not pposition.zeroForOne:
                 amounts0_locked[i] = pposition.size + pposition.margin + pposition.debt0 + pposition.insurance0
                 amounts1_locked[i] = pposition.insurance1
@@ -180,58 +309,118 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
 
         return (amounts0_locked, amounts1_locked)
 
+    def get_balances_pool(self) -> List[int]:
+        """
+        Gets the mock token balances of the Marginal v1 pool, sending reads
+        in one JSON-RPC batch request.
+
+        Returns:
+            balances_pool (List[int]): Pool balances for [token0, token1]
+        """
+        balance_of_abi = self._abis["tokens.balanceOf"]
+        results = make_batch_request(
+            [
+                get_eth_call_request(mock_token, balance_of_abi, self._addrs["mrglv1_pool"], block_identifier="latest")
+                for mock_token in self._mocks["tokens"]
+            ]
+        )
+        for result in results:
+            if isinstance(result, ProviderError):
+                raise result
+
+        return [decode_eth_call_response(balance_of_abi, result) for result in results]
+
+    def get_mrglv1_state(self) -> Any:
+        """
+        Gets the state of the mock Marginal v1 pool, cached until the next
+        transaction that changes it.
+
+        Returns:
+            mrglv1_state (Any): The state of the Marginal v1 pool
+        """
+        if self._mrglv1_state is None:
+            self._mrglv1_state = self._mocks["mrglv1_pool"].state()
+        return self._mrglv1_state
+
+    def echo(self, message: str, *args, **styles):
+        """
+        Echoes the message if verbose, so strategy updates at each block
+        can skip terminal output through long backtests. Message is only
+        formatted with args when echoed, and buffered until flushed.
+
+        Args:
+            message (str): The message to echo, with %-style placeholders for args.
+        """
+        if self.verbose:
+            message = message % args if args else message
+            self._echo_lines.append(click.style(message, **styles) if styles else message)
+
+    def flush_echoes(self):
+        """
+        Writes out buffered echoed messages in one write.
+        """
+        if len(self._echo_lines) > 0:
+            click.echo("\n".join(self._echo_lines))
+            self._echo_lines.clear()
+
     def arb_pools(self):
         """
         Arbs price differences between Marginal v1 pool and Uniswap v3 pool
         if below tolerance.
         """
-        mock_tokens = self._mocks["tokens"]
         mock_univ3_pool = self._mocks["univ3_pool"]
-        mock_mrglv1_pool = self._mocks["mrglv1_pool"]
         mock_mrglv1_arbitrageur = self._mocks["mrglv1_arbitrageur"]
-        ref_WETH9 = self._refs["WETH9"]
 
-        univ3_sqrt_price_x96 = mock_univ3_pool.slot0().sqrtPriceX96
-        mrglv1_state_before = mock_mrglv1_pool.state()
+        if self._univ3_sqrt_price_x96 is None:
+            self._univ3_sqrt_price_x96 = mock_univ3_pool.slot0().sqrtPriceX96
+
+        univ3_sqrt_price_x96 = self._univ3_sqrt_price_x96
+        mrglv1_state_before = self.get_mrglv1_state()
         mrglv1_sqrt_price_x96 = mrglv1_state_before.sqrtPriceX96
         rel_sqrt_price_diff = univ3_sqrt_price_x96 / mrglv1_sqrt_price_x96 - 1
 
-        click.echo(f"Uniswap v3 sqrt price X96 before arbitrage: {univ3_sqrt_price_x96}")
-        click.echo(f"Marginal v1 sqrt price X96 before arbitrage: {mrglv1_sqrt_price_x96}")
-        click.echo(f"Relative difference in sqrt price X96 values before arbitrage: {rel_sqrt_price_diff}")
+        self.echo("Uniswap v3 sqrt price X96 before arbitrage: %s", univ3_sqrt_price_x96)
+        self.echo("Marginal v1 sqrt price X96 before arbitrage: %s", mrglv1_sqrt_price_x96)
+        self.echo("Relative difference in sqrt price X96 values before arbitrage: %s", rel_sqrt_price_diff)
 
         if abs(rel_sqrt_price_diff) <= self.sqrt_price_tol:
             return
 
-        token_out = ref_WETH9.address if ref_WETH9.address in mock_tokens else mock_tokens[1].address
-        sweep_as_eth = ref_WETH9.address == token_out
+        token_out = (
+            self._addrs["WETH9"]
+            if self._addrs["WETH9"] in [self._addrs["token0"], self._addrs["token1"]]
+            else self._addrs["token1"]
+        )
+        sweep_as_eth = self._addrs["WETH9"] == token_out
         execute_params = (
-            mock_tokens[0],
-            mock_tokens[1],
+            self._addrs["token0"],
+            self._addrs["token1"],
             self.maintenance,
-            mock_univ3_pool.address,
-            self.acc.address,
+            self._addrs["univ3_pool"],
+            self._addrs["acc"],
             token_out,
             0,
             0,
             0,
-            2**256 - 1,
+            MAX_UINT256,
             sweep_as_eth,
         )
-        click.echo("Arbitraging Marginal v1 and Uniswap v3 pools ...")
+        self.echo("Arbitraging Marginal v1 and Uniswap v3 pools ...")
         mock_mrglv1_arbitrageur.execute(execute_params, sender=self.acc)
+        self._mrglv1_state = None
 
         univ3_sqrt_price_x96 = mock_univ3_pool.slot0().sqrtPriceX96
-        mrglv1_state_after = mock_mrglv1_pool.state()
+        self._univ3_sqrt_price_x96 = univ3_sqrt_price_x96
+        mrglv1_state_after = self.get_mrglv1_state()
         mrglv1_sqrt_price_x96 = mrglv1_state_after.sqrtPriceX96
         rel_sqrt_price_diff = univ3_sqrt_price_x96 / mrglv1_sqrt_price_x96 - 1
 
-        click.echo(f"Uniswap v3 sqrt price X96 after arbitrage: {univ3_sqrt_price_x96}")
-        click.echo(f"Marginal v1 sqrt price X96 after arbitrage: {mrglv1_sqrt_price_x96}")
-        click.echo(f"Relative difference in sqrt price X96 values after arbitrage: {rel_sqrt_price_diff}")
+        self.echo("Uniswap v3 sqrt price X96 after arbitrage: %s", univ3_sqrt_price_x96)
+        self.echo("Marginal v1 sqrt price X96 after arbitrage: %s", mrglv1_sqrt_price_x96)
+        self.echo("Relative difference in sqrt price X96 values after arbitrage: %s", rel_sqrt_price_diff)
 
         liquidity_delta_fees = mrglv1_state_after.liquidity - mrglv1_state_before.liquidity
-        click.echo(f"Liquidity gained from arbitrage fee volume: {liquidity_delta_fees}")
+        self.echo("Liquidity gained from arbitrage fee volume: %s", liquidity_delta_fees)
         self._net_liquidity_swap_fees_cumulative += liquidity_delta_fees
 
     def simulate_swaps(self, state: Mapping):
@@ -242,10 +431,8 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
         Args:
             state (Mapping): The state of references at block
         """
-        mock_tokens = self._mocks["tokens"]
         mock_mrglv1_pool = self._mocks["mrglv1_pool"]
         mock_mrglv1_router = self._mocks["mrglv1_router"]
-        mock_univ3_pool = self._mocks["univ3_pool"]
 
         # net fee growth is cumulative fee amounts per unit of liquidity since last check
         net_univ3_fee_growth_global_x128 = [
@@ -255,74 +442,57 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
 
         # to be conservative, take avg between fees0 and fees1 in 1 terms, then swap size back and forth to simulate
         net_univ3_fee_volumes = [
-            (net_univ3_fee_growth_global_x128[0] * state["liquidity"]) // (1 << 128),
-            (net_univ3_fee_growth_global_x128[1] * state["liquidity"]) // (1 << 128),
+            (net_univ3_fee_growth_global_x128[0] * state["liquidity"]) >> 128,
+            (net_univ3_fee_growth_global_x128[1] * state["liquidity"]) >> 128,
         ]
-        price = (state["slot0"].sqrtPriceX96 ** 2) / (1 << 192)
-        net_univ3_fee_volume1 = int((price * net_univ3_fee_volumes[0] + net_univ3_fee_volumes[1]) / 2)
-        click.echo(f"Net Uniswap v3 fee volumes: {net_univ3_fee_volumes}")
-        click.echo(f"Min Uniswap v3 fee volume in token1 terms: {net_univ3_fee_volume1}")
+        sqrt_price_x96 = state["slot0"].sqrtPriceX96
+        net_univ3_fee_volume1 = (
+            ((sqrt_price_x96 * sqrt_price_x96 * net_univ3_fee_volumes[0]) >> 192) + net_univ3_fee_volumes[1]
+        ) // 2
+        self.echo("Net Uniswap v3 fee volumes: %s", net_univ3_fee_volumes)
+        self.echo("Min Uniswap v3 fee volume in token1 terms: %s", net_univ3_fee_volume1)
 
         # scale mrglv1 fee volumes by: mrglv1 fee volume = (mrgl v1 liquidity / uni v3 liquidity) * uni v3 fee volume
         # roughly given uniswap dashboard (TODO: examine historical data)
-        mrglv1_state = mock_mrglv1_pool.state()
-        mrglv1_fee = mock_mrglv1_pool.fee()
+        mrglv1_state = self.get_mrglv1_state()
         net_mrglv1_fee_volume1 = (net_univ3_fee_volume1 * mrglv1_state.liquidity) // state["liquidity"]
-        click.echo(f"Desired net Marginal v1 fee1 volumes: {net_mrglv1_fee_volume1}")
+        self.echo("Desired net Marginal v1 fee1 volumes: %s", net_mrglv1_fee_volume1)
 
         # get size to generate that volume on one side of two swaps (1 => 0 then 0 => 1)
-        click.echo(f"Marginal v1 state before swaps: {mrglv1_state}")
-        amount1_in = (net_mrglv1_fee_volume1 * FEE_UNIT) // mrglv1_fee
-        click.echo(f"Desired amount1 in to Marginal v1 pool for swaps: {amount1_in}")
+        self.echo("Marginal v1 state before swaps: %s", mrglv1_state)
+        amount1_in = (net_mrglv1_fee_volume1 * FEE_UNIT) // self._mrglv1_fee
+        self.echo("Desired amount1 in to Marginal v1 pool for swaps: %s", amount1_in)
         if amount1_in == 0:
             return
 
+        # swap amount1 in then amount0 out back (1 => 0 => 1) as two hops through the same pool in one tx
         swap_params = (
-            mock_tokens[1],
-            mock_tokens[0],
-            self.maintenance,
-            mock_univ3_pool.address,
-            self.acc.address,
-            2**256 - 1,
+            self._swap_path,
+            self._addrs["acc"],
+            MAX_UINT256,
             amount1_in,
             0,
-            0,
-        )
-        receipt = mock_mrglv1_router.exactInputSingle(swap_params, sender=self.acc)
-        amount0_out = -receipt.decode_logs(mock_mrglv1_pool.Swap)[0].amount0
-        click.echo(f"Swapped token1 amount in {amount1_in} for token0 amount out {amount0_out}.")
-
-        mrglv1_state_between = mock_mrglv1_pool.state()
-        click.echo(f"Marginal v1 state between swaps: {mrglv1_state_between}")
-
-        # swap amount0 back (0 => 1)
-        swap_params = (
-            mock_tokens[0],
-            mock_tokens[1],
-            self.maintenance,
-            mock_univ3_pool.address,
-            self.acc.address,
-            2**256 - 1,
-            amount0_out,
-            0,
-            0,
         )
-        receipt = mock_mrglv1_router.exactInputSingle(swap_params, sender=self.acc)
-        amount1_out = -receipt.decode_logs(mock_mrglv1_pool.Swap)[0].amount1
-        click.echo(f"Swapped token0 amount in {amount0_out} for token1 amount out {amount1_out}.")
+        receipt = mock_mrglv1_router.exactInput(swap_params, sender=self.acc)
+        self._mrglv1_state = None
+        amount0_out = -self.decode_log_args(receipt, mock_mrglv1_pool, "Swap", ["amount0"], index=0)["amount0"]
+        self.echo("Swapped token1 amount in %s for token0 amount out %s.", amount1_in, amount0_out)
+        amount1_out = -self.decode_log_args(receipt, mock_mrglv1_pool, "Swap", ["amount1"], index=1)["amount1"]
+        self.echo("Swapped token0 amount in %s for token1 amount out %s.", amount0_out, amount1_out)
 
         # check fee volume growth due to swaps
-        mrglv1_state_after = mock_mrglv1_pool.state()
-        click.echo(f"Marginal v1 state after swaps: {mrglv1_state_after}")
+        mrglv1_state_after = self.get_mrglv1_state()
+        self.echo("Marginal v1 state after swaps: %s", mrglv1_state_after)
         liquidity_delta_fees = mrglv1_state_after.liquidity - mrglv1_state.liquidity
-        click.echo(f"Liquidity gained from fee volume: {liquidity_delta_fees}")
+        self.echo("Liquidity gained from fee volume: %s", liquidity_delta_fees)
         self._net_liquidity_swap_fees_cumulative += liquidity_delta_fees
 
-        fees0_delta, fees1_delta = get_mrglv1_amounts_for_liquidity(
-            mrglv1_state_after.sqrtPriceX96,
-            liquidity_delta_fees,
-        )
-        click.echo(f"Amounts gained from fee volume: {[fees0_delta, fees1_delta]}")
+        if self.verbose:
+            fees0_delta, fees1_delta = get_mrglv1_amounts_for_liquidity(
+                mrglv1_state_after.sqrtPriceX96,
+                liquidity_delta_fees,
+            )
+            self.echo("Amounts gained from fee volume: %s", [fees0_delta, fees1_delta])
 
     def setup(self, mocking: bool = True):
         """
@@ -331,6 +501,18 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
         Args:
             mocking (bool): Whether to deploy mocks.
         """
+        # only cache refs state at blocks upstream of fork, before any local blocks mined deploying mocks
+        self._chain_id = chain.chain_id
+        fork_number = self.get_fork_number()
+        if fork_number is None:
+            click.secho(
+                "Fork block_number not set in ape-config.yaml. Not caching refs state ...",
+                fg="yellow",
+            )
+            self._refs_cache_max_number = -1
+        else:
+            self._refs_cache_max_number = fork_number - self._refs_cache_finality
+
         super().setup(mocking=mocking)
         if not mocking:
             raise Exception("Only mocking supported")
@@ -338,12 +520,176 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
         # deploy the backtester
         pool_addr = self._mocks["mrglv1_pool"].address
         self.deploy_strategy(*[pool_addr])
+
+        # cache addresses used in params of calls to mocks
+        self._addrs = {
+            "WETH9": self._refs["WETH9"].address,
+            "token0": self._mocks["tokens"][0].address,
+            "token1": self._mocks["tokens"][1].address,
+            "univ3_pool": self._mocks["univ3_pool"].address,
+            "mrglv1_pool": self._mocks["mrglv1_pool"].address,
+            "mrglv1_manager": self._mocks["mrglv1_manager"].address,
+            "acc": self.acc.address,
+        }
+
+        # cache abis of methods called through backtest
+        ref_univ3_pool = self._refs["univ3_pool"]
+        mock_univ3_pool = self._mocks["univ3_pool"]
+        self._abis = {
+            "univ3_pool.slot0": ref_univ3_pool.slot0.abis[0],
+            "univ3_pool.liquidity": ref_univ3_pool.liquidity.abis[0],
+            "univ3_pool.feeGrowthGlobal0X128": ref_univ3_pool.feeGrowthGlobal0X128.abis[0],
+            "univ3_pool.feeGrowthGlobal1X128": ref_univ3_pool.feeGrowthGlobal1X128.abis[0],
+            "univ3_pool.observe": ref_univ3_pool.observe.abis[0],
+            "mrglv1_manager.positions": self._mocks["mrglv1_manager"].positions.abis[0],
+            "mrglv1_pool.positions": self._mocks["mrglv1_pool"].positions.abis[0],
+            "tokens.balanceOf": self._mocks["tokens"][0].balanceOf.abis[0],
+            "univ3_pool.setSlot0": mock_univ3_pool.setSlot0.abis[0],
+            "univ3_pool.setLiquidity": mock_univ3_pool.setLiquidity.abis[0],
+            "univ3_pool.setFeeGrowthGlobalX128": mock_univ3_pool.setFeeGrowthGlobalX128.abis[0],
+            "univ3_pool.pushObservation": mock_univ3_pool.pushObservation.abis[0],
+            "mrglv1_initializer.createAndInitializePoolIfNecessary": (
+                self._mocks["mrglv1_initializer"].createAndInitializePoolIfNecessary.abis[0]
+            ),
+        }
+
+        # cache slot0 struct field names to encode set state calldata
+        self._slot0_fields = [component.name for component in self._abis["univ3_pool.setSlot0"].inputs[0].components]
+
+        # cache router path to swap back and forth through mrglv1 pool: token1, maintenance, oracle, token0, ...
+        self._swap_path = encode_packed(
+            ["address", "uint24", "address", "address", "uint24", "address", "address"],
+            [
+                self._addrs["token1"],
+                self.maintenance,
+                self._addrs["univ3_pool"],
+                self._addrs["token0"],
+                self.maintenance,
+                self._addrs["univ3_pool"],
+                self._addrs["token1"],
+            ],
+        )
+
+        # cache oracle seconds ago and fee as immutables on mock pool
+        self._seconds_ago = self._mocks["mrglv1_pool"].secondsAgo()
+        self._mrglv1_fee = self._mocks["mrglv1_pool"].fee()
         self._initialized = True
 
+    def get_fork_number(self) -> Optional[int]:
+        """
+        Gets the block number the provider forked from upstream at, as set in the provider fork config.
+
+        Returns:
+            Optional[int]: The fork block number, or None if forked at the upstream head.
+        """
+        ecosystem_name = chain.provider.network.ecosystem.name
+        try:
+            return chain.provider.config.fork[ecosystem_name]["mainnet"].block_number
+        except (AttributeError, KeyError) as err:
+            raise Exception(f"Provider fork config not found for {ecosystem_name}:mainnet.") from err
+
+    def backtest(
+        self,
+        path: str,
+        start: int,
+        stop: Optional[int] = None,
+        step: Optional[int] = 1,
+    ):
+        """
+        Overrides backtest to store the block numbers iterated over, so
+        the state of references can be prefetched ahead of each step, and
+        to close the results file records are streamed to once done.
+
+        Args:
+            path (str): The path to the csv file to write the record to.
+            start (int): The start block number.
+            stop (Optional[int]): The stop block number.
+            step (Optional[int]): The step interval size.
+        """
+        stop_number = stop if stop is not None else chain.blocks.head.number
+        self._prefetch_numbers = [start] + list(range(start + 1, stop_number, step))
+        self._prefetch_cursor = 0
+        try:
+            super().backtest(path, start, stop, step)
+        finally:
+            self._prefetch_numbers = []
+            self.flush_echoes()
+            self.shutdown_prefetch()
+            self.close_record_file()
+
+    def replay(
+        self,
+        path: str,
+        start: int,
+        stop: Optional[int] = None,
+    ):
+        """
+        Overrides replay to close the results file records are streamed to once done.
+
+        Args:
+            path (str): The path to the csv file to write the record to.
+            start (int): The start block number.
+            stop (Optional[int]): The stop block number.
+        """
+        try:
+            super().replay(path, start, stop)
+        finally:
+            self.flush_echoes()
+            self.shutdown_prefetch()
+            self.close_record_file()
+
+    def close_record_file(self):
+        """
+        Flushes and closes the results file opened on first record, if any.
+        """
+        if self._record_file is not None:
+            self._record_file.close()
+            self._record_file = None
+            self._record_writer = None
+
+    def shutdown_prefetch(self):
+        """
+        Cancels refs state windows still queued for prefetch, waits on those
+        in flight, then shuts down the prefetch workers and closes the refs cache.
+        """
+        for future in self._refs_states_prefetched.values():
+            future.cancel()
+        self._refs_states_prefetched = {}
+
+        if self._prefetch_executor is not None:
+            self._prefetch_executor.shutdown(wait=True)
+            self._prefetch_executor = None
+
+        with self._refs_cache_lock:
+            if self._refs_cache is not None:
+                self._refs_cache.close()
+                self._refs_cache = None
+
+    def prefetch_refs_states(self, numbers: List[int]):
+        """
+        Fetches the state of references at the given blocks in the background.
+        Batches are spread across worker threads, as refs state at a block
+        doesn't depend on the backtest state at prior blocks.
+
+        Args:
+            numbers (List[int]): The block numbers.
+        """
+        if self._prefetch_executor is None:
+            self._prefetch_executor = ThreadPoolExecutor(max_workers=self._prefetch_workers)
+
+        future = self._prefetch_executor.submit(self.get_refs_states, numbers, self._seconds_ago)
+        for number in numbers:
+            self._refs_states_prefetched[number] = future
+
     def get_refs_state(self, number: Optional[int] = None) -> Mapping:
         """
         Gets the state of references at given block.
 
+        Pops the state from the prefetched states if there, and keeps the
+        next batches of backtest block numbers in flight while the caller
+        processes this block. Messages from fetching the state on a prefetch
+        worker are echoed here, so they stay in order with the block.
+
         Args:
             number (int): The block number. If None, then last block
                 from current provider chain.
@@ -352,51 +698,165 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
             Mapping: The state of references at block.
         """
         block_identifier = get_block_identifier(number)
-        ref_univ3_pool = self._refs["univ3_pool"]
-        seconds_ago = self._mocks["mrglv1_pool"].secondsAgo()
-        state = {}
-
-        state["slot0"] = ref_univ3_pool.slot0(block_identifier=block_identifier)
-        state["liquidity"] = ref_univ3_pool.liquidity(block_identifier=block_identifier)
-        state["fee_growth_global0_x128"] = ref_univ3_pool.feeGrowthGlobal0X128(block_identifier=block_identifier)
-        state["fee_growth_global1_x128"] = ref_univ3_pool.feeGrowthGlobal1X128(block_identifier=block_identifier)
-
-        # build associated observations array
-        timestamp = chain.blocks[block_identifier].timestamp
-        tick_cumulatives, seconds_per_liquidity_cumulatives = ref_univ3_pool.observe(
-            [0], block_identifier=block_identifier
-        )
-        state["observation1"] = (timestamp, tick_cumulatives[0], seconds_per_liquidity_cumulatives[0], True)
+        numbers = self._prefetch_numbers
+        if block_identifier not in self._refs_states_prefetched:
+            if self._prefetch_cursor < len(numbers) and numbers[self._prefetch_cursor] == block_identifier:
+                self._prefetch_cursor += self._prefetch_size
+                self.prefetch_refs_states(numbers[self._prefetch_cursor - self._prefetch_size : self._prefetch_cursor])
+            else:
+                self.prefetch_refs_states([block_identifier])
 
-        # try catch to avoid block out of range errors
-        try:
-            tick_cumulatives, seconds_per_liquidity_cumulatives = ref_univ3_pool.observe(
-                [seconds_ago], block_identifier=block_identifier
+        future = self._refs_states_prefetched.pop(block_identifier)
+        while (
+            len(self._refs_states_prefetched) < self._prefetch_size * self._prefetch_workers
+            and self._prefetch_cursor < len(numbers)
+        ):
+            self._prefetch_cursor += self._prefetch_size
+            self.prefetch_refs_states(numbers[self._prefetch_cursor - self._prefetch_size : self._prefetch_cursor])
+
+        states, messages = future.result()
+        for message in messages.get(block_identifier, []):
+            click.echo(message)
+
+        return states[block_identifier]
+
+    def get_refs_states(
+        self, numbers: List[int], seconds_ago: int
+    ) -> Tuple[Mapping[int, Mapping], Mapping[int, List[str]]]:
+        """
+        Gets the state of references at the given blocks, batching reads of
+        refs at all blocks into JSON-RPC batch requests. Messages are returned
+        rather than echoed, as this may run on a prefetch worker thread.
+
+        Args:
+            numbers (List[int]): The block numbers.
+            seconds_ago (int): The seconds ago of the mock Marginal v1 pool oracle.
+
+        Returns:
+            Tuple[Mapping[int, Mapping], Mapping[int, List[str]]]: The state of references
+                and any messages to echo at each block.
+        """
+        ref_univ3_pool = self._refs["univ3_pool"]
+        abis = {
+            "slot0": self._abis["univ3_pool.slot0"],
+            "liquidity": self._abis["univ3_pool.liquidity"],
+            "fee_growth_global0_x128": self._abis["univ3_pool.feeGrowthGlobal0X128"],
+            "fee_growth_global1_x128": self._abis["univ3_pool.feeGrowthGlobal1X128"],
+        }
+        observe_abi = self._abis["univ3_pool.observe"]
+
+        # only request refs at blocks not already in the on-disk cache
+        with self._refs_cache_lock:
+            if self._refs_cache is None:
+                self._refs_cache = open_refs_cache(self._refs_cache_path)
+
+            results = get_cached_refs_results(
+                self._refs_cache,
+                self._chain_id,
+                ref_univ3_pool.address,
+                numbers,
+                seconds_ago,
+                self._refs_cache_max_number,
             )
-        except ProviderError as err:
-            click.secho(
-                f"Error on getting seconds ago from oracle observations at block {block_identifier}: {err}", blink=True
+        numbers_missing = [number for number in numbers if number not in results]
+
+        calls = []
+        for block_identifier in numbers_missing:
+            calls += [
+                get_eth_call_request(ref_univ3_pool, abi, block_identifier=block_identifier) for abi in abis.values()
+            ]
+            calls += [
+                get_eth_call_request(ref_univ3_pool, observe_abi, [0], block_identifier=block_identifier),
+                get_eth_call_request(ref_univ3_pool, observe_abi, [seconds_ago], block_identifier=block_identifier),
+                ("eth_getBlockByNumber", [hex(block_identifier), False]),
+            ]
+        results_missing = make_batch_request(calls) if len(calls) > 0 else []
+
+        n = len(abis) + 3  # number of requests per block
+        for j, block_identifier in enumerate(numbers_missing):
+            block_results = results_missing[j * n : (j + 1) * n]
+            if not isinstance(block_results[-1], ProviderError):
+                block_results[-1] = {"timestamp": block_results[-1]["timestamp"]}  # only need block timestamp
+            results[block_identifier] = block_results
+
+        # cache blocks fetched without errors that are final upstream of fork
+        with self._refs_cache_lock:
+            set_cached_refs_results(
+                self._refs_cache,
+                self._chain_id,
+                ref_univ3_pool.address,
+                {
+                    number: results[number]
+                    for number in numbers_missing
+                    if not any(isinstance(result, ProviderError) for result in results[number])
+                },
+                seconds_ago,
+                self._refs_cache_max_number,
             )
-            click.echo(f"Attempting rough approx with observe([0]) at block {block_identifier - seconds_ago // 12}")
-            prior_block_identifier = block_identifier - seconds_ago // 12
-            prior_timestamp = chain.blocks[prior_block_identifier].timestamp
-            tick_cumulatives, seconds_per_liquidity_cumulatives = ref_univ3_pool.observe(
-                [0], block_identifier=prior_block_identifier
+
+        states = {}
+        messages = {}
+        for block_identifier in numbers:
+            block_results = results[block_identifier]
+            for result in block_results[:-2] + block_results[-1:]:
+                if isinstance(result, ProviderError):
+                    raise result
+
+            state = {}
+            for i, key in enumerate(abis.keys()):
+                state[key] = decode_eth_call_response(abis[key], block_results[i])
+
+            # build associated observations array
+            timestamp = int(block_results[-1]["timestamp"], 16)
+            tick_cumulatives, seconds_per_liquidity_cumulatives = decode_eth_call_response(
+                observe_abi, block_results[-3]
             )
+            state["observation1"] = (timestamp, tick_cumulatives[0], seconds_per_liquidity_cumulatives[0], True)
+
+            # check for errors to avoid block out of range errors
+            if not isinstance(block_results[-2], ProviderError):
+                tick_cumulatives, seconds_per_liquidity_cumulatives = decode_eth_call_response(
+                    observe_abi, block_results[-2]
+                )
+            else:
+                err = block_results[-2]
+                messages[block_identifier] = [
+                    click.style(
+                        f"Error on getting seconds ago from oracle observations at block {block_identifier}: {err}",
+                        blink=True,
+                    ),
+                    f"Attempting rough approx with observe([0]) at block {block_identifier - seconds_ago // 12}",
+                ]
+                prior_block_identifier = block_identifier - seconds_ago // 12
+                prior_results = make_batch_request(
+                    [
+                        get_eth_call_request(ref_univ3_pool, observe_abi, [0], block_identifier=prior_block_identifier),
+                        ("eth_getBlockByNumber", [hex(prior_block_identifier), False]),
+                    ]
+                )
+                for result in prior_results:
+                    if isinstance(result, ProviderError):
+                        raise result
 
-            # interpolate tick cumulatives if prior_timestamp != timestamp - seconds_ago given mock oracle
-            prior_tick = ref_univ3_pool.slot0(block_identifier=block_identifier).tick  # roughly
-            prior_dt = prior_timestamp - (timestamp - seconds_ago)
-            tick_cumulatives[0] -= prior_tick * prior_dt
+                prior_timestamp = int(prior_results[-1]["timestamp"], 16)
+                tick_cumulatives, seconds_per_liquidity_cumulatives = decode_eth_call_response(
+                    observe_abi, prior_results[0]
+                )
 
-        state["observation0"] = (
-            timestamp - seconds_ago,
-            tick_cumulatives[0],
-            seconds_per_liquidity_cumulatives[0],
-            True,
-        )
+                # interpolate tick cumulatives if prior_timestamp != timestamp - seconds_ago given mock oracle
+                prior_tick = state["slot0"].tick  # roughly
+                prior_dt = prior_timestamp - (timestamp - seconds_ago)
+                tick_cumulatives[0] -= prior_tick * prior_dt
 
-        return state
+            state["observation0"] = (
+                timestamp - seconds_ago,
+                tick_cumulatives[0],
+                seconds_per_liquidity_cumulatives[0],
+                True,
+            )
+            states[block_identifier] = state
+
+        return states, messages
 
     def init_mocks_state(self, number: int, state: Mapping):
         """
@@ -408,10 +868,8 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
         """
         mock_univ3_pool = self._mocks["univ3_pool"]
         mock_mrglv1_initializer = self._mocks["mrglv1_initializer"]
-        mock_mrglv1_manager = self._mocks["mrglv1_manager"]
         mock_mrglv1_router = self._mocks["mrglv1_router"]
         mock_tokens = self._mocks["tokens"]
-        ecosystem = chain.provider.network.ecosystem
 
         # set the current state of univ3 and mrglv1 pools
         self.set_mocks_state(state)
@@ -424,42 +882,18 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
         #  - univ3 pool so swaps work
         #  - backtester to add liquidity to mrglv1 pool
         #  - self.acc to take out positions on mrglv1 pool
-        mock_token_addresses = [[mock_token.address for mock_token in mock_tokens] for i in range(3)]
-        targets = sum(mock_token_addresses, [])
-        datas = [
-            ecosystem.encode_transaction(
-                mock_token.address,
-                mock_token.mint.abis[0],
-                self.backtester.address,
-                2**128 - 1,
-            ).data
-            for i, mock_token in enumerate(mock_tokens)
-        ]
-        datas += [
-            ecosystem.encode_transaction(
-                mock_token.address,
-                mock_token.mint.abis[0],
-                mock_univ3_pool.address,
-                2**128 - 1,
-            ).data
-            for i, mock_token in enumerate(mock_tokens)
-        ]
-        datas += [
-            ecosystem.encode_transaction(
-                mock_token.address,
-                mock_token.approve.abis[0],
-                mock_mrglv1_initializer.address,
-                2**256 - 1,
-            ).data
-            for i, mock_token in enumerate(mock_tokens)
-        ]
-        values = [0 for _ in range(6)]
-        self.backtester.multicall(targets, datas, values, sender=self.acc)
+        self.backtester.setupTokens(
+            [self._addrs["token0"], self._addrs["token1"]],
+            self._addrs["univ3_pool"],
+            self._addrs["acc"],
+            mock_mrglv1_initializer.address,
+            sender=self.acc,
+        )
 
+        # approvals must come from self.acc so can't be folded into setup tokens
         for mock_token in mock_tokens:
-            mock_token.mint(self.acc.address, 2**128 - 1, sender=self.acc)
-            mock_token.approve(mock_mrglv1_manager.address, 2**256 - 1, sender=self.acc)
-            mock_token.approve(mock_mrglv1_router.address, 2**256 - 1, sender=self.acc)
+            mock_token.approve(self._addrs["mrglv1_manager"], MAX_UINT256, sender=self.acc)
+            mock_token.approve(mock_mrglv1_router.address, MAX_UINT256, sender=self.acc)
 
         # mint the LP position via the mrglv1 initializer
         sqrt_price_x96_desired = state["slot0"].sqrtPriceX96
@@ -468,34 +902,93 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
             self.liquidity,
         )
         initialize_params = (
-            mock_tokens[0],  # token0
-            mock_tokens[1],  # token1
+            self._addrs["token0"],
+            self._addrs["token1"],
             self.maintenance,
             mock_univ3_pool.fee(),
             self.backtester.address,  # recipient
             sqrt_price_x96_desired,
             0,
             MINIMUM_LIQUIDITY**2,  # liquidity to burn
-            2**255 - 1,
-            2**255 - 1,
+            MAX_INT256,
+            MAX_INT256,
             amount0_desired,
             amount1_desired,
             0,
             0,
-            2**256 - 1,
+            MAX_UINT256,
         )
 
         # execute through backtester
         self.backtester.execute(
             mock_mrglv1_initializer.address,
-            ecosystem.encode_transaction(
-                mock_mrglv1_initializer.address,
-                mock_mrglv1_initializer.createAndInitializePoolIfNecessary.abis[0],
-                initialize_params,
-            ).data,
+            encode_calldata(self._abis["mrglv1_initializer.createAndInitializePoolIfNecessary"], initialize_params),
             0,
             sender=self.acc,
         )
+        self._mrglv1_state = None
+
+    def decode_log_args(
+        self, receipt: Any, contract: ContractInstance, event_name: str, names: List[str], index: int = 0
+    ) -> Mapping[str, Any]:
+        """
+        Decodes only the named args of the log at index among those emitted by the contract
+        event in the receipt, caching the event topic and input layout on first decode.
+
+        Args:
+            receipt (:class:`ape.api.transactions.ReceiptAPI`): The transaction receipt.
+            contract (:class:`ape.contracts.ContractInstance`): The contract emitting the event.
+            event_name (str): The name of the contract event.
+            names (List[str]): The names of the event args to decode.
+            index (int): The index of the log among those emitted by the contract event.
+
+        Returns:
+            Mapping[str, Any]: The decoded event args by name.
+        """
+        key = (contract.address, event_name)
+        if key not in self._event_templates:
+            abi = getattr(contract, event_name).abi
+            inputs = {}
+            types = []
+            num_indexed = 0
+            for abi_input in abi.inputs:
+                if abi_input.indexed:
+                    inputs[abi_input.name] = (True, num_indexed, abi_input.canonical_type)
+                    num_indexed += 1
+                else:
+                    inputs[abi_input.name] = (False, len(types), abi_input.canonical_type)
+                    types.append(abi_input.canonical_type)
+
+            # elementary static types each take up exactly one word of log data
+            aligned = all(not any(c in type_ for c in "[(") and type_ not in ("bytes", "string") for type_ in types)
+            self._event_templates[key] = (keccak(text=abi.selector), inputs, types, aligned)
+
+        topic, inputs, types, aligned = self._event_templates[key]
+        address = contract.address.lower()
+        for log in receipt.logs:
+            if log["address"].lower() != address or HexBytes(log["topics"][0]) != topic:
+                continue
+            elif index > 0:
+                index -= 1
+                continue
+
+            args = {}
+            data = HexBytes(log["data"])
+            values = None  # full data decode, only if not word aligned
+            for name in names:
+                indexed, position, type_ = inputs[name]
+                if indexed:
+                    args[name] = decode([type_], HexBytes(log["topics"][position + 1]))[0]
+                elif aligned:
+                    args[name] = decode([type_], data[32 * position : 32 * (position + 1)])[0]
+                else:
+                    if values is None:
+                        values = decode(types, data)
+                    args[name] = values[position]
+
+            return args
+
+        raise Exception(f"{event_name} log not found in receipt.")
 
     def set_mocks_state(self, state: Mapping):
         """
@@ -506,16 +999,20 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
         """
         # update mock univ3 pool for state attrs
         mock_univ3_pool = self._mocks["univ3_pool"]
+        slot0 = tuple(getattr(state["slot0"], name) for name in self._slot0_fields)
         datas = [
-            mock_univ3_pool.setSlot0.as_transaction(state["slot0"]).data,
-            mock_univ3_pool.setLiquidity.as_transaction(state["liquidity"]).data,
-            mock_univ3_pool.setFeeGrowthGlobalX128.as_transaction(
-                state["fee_growth_global0_x128"], state["fee_growth_global1_x128"]
-            ).data,
-            mock_univ3_pool.pushObservation.as_transaction(*state["observation0"]).data,
-            mock_univ3_pool.pushObservation.as_transaction(*state["observation1"]).data,
+            encode_calldata(self._abis["univ3_pool.setSlot0"], slot0),
+            encode_calldata(self._abis["univ3_pool.setLiquidity"], state["liquidity"]),
+            encode_calldata(
+                self._abis["univ3_pool.setFeeGrowthGlobalX128"],
+                state["fee_growth_global0_x128"],
+                state["fee_growth_global1_x128"],
+            ),
+            encode_calldata(self._abis["univ3_pool.pushObservation"], *state["observation0"]),
+            encode_calldata(self._abis["univ3_pool.pushObservation"], *state["observation1"]),
         ]
         mock_univ3_pool.calls(datas, sender=self.acc)
+        self._univ3_sqrt_price_x96 = state["slot0"].sqrtPriceX96
 
     def update_strategy(self, number: int, state: Mapping):
         """
@@ -527,8 +1024,6 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
             number (int): The block number.
             state (Mapping): The state of references at block number.
         """
-        mock_tokens = self._mocks["tokens"]
-        mock_univ3_pool = self._mocks["univ3_pool"]
         mock_mrglv1_manager = self._mocks["mrglv1_manager"]
         mock_mrglv1_quoter = self._mocks["mrglv1_quoter"]
         mock_mrglv1_pool = self._mocks["mrglv1_pool"]
@@ -537,11 +1032,11 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
         if self._last_univ3_observation1[0] != -1:
             last_oracle_timestamp = self._last_univ3_observation1[0]
             next_oracle_timestamp = state["observation1"][0]
-            click.echo(f"Last oracle timestamp strategy updated: {last_oracle_timestamp}")
-            click.echo(f"Next oracle timestamp strategy updated: {next_oracle_timestamp}")
+            self.echo("Last oracle timestamp strategy updated: %s", last_oracle_timestamp)
+            self.echo("Next oracle timestamp strategy updated: %s", next_oracle_timestamp)
             dt = next_oracle_timestamp - last_oracle_timestamp
-            click.echo(f"Time between strategy updates: {dt}")
-            click.echo(f"Mining {dt} seconds to catch up ..")
+            self.echo("Time between strategy updates: %s", dt)
+            self.echo("Mining %s seconds to catch up ..", dt)
             chain.mine(deltatime=dt)
 
         self._last_univ3_observation1 = state["observation1"]
@@ -550,79 +1045,85 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
         self.arb_pools()
 
         # liquidate or settle outstanding positions
-        for i, token_id in enumerate(self._token_ids.copy()):
+        for i, token_id in enumerate(self._token_ids):
             if token_id == -1:
                 # no position there
                 continue
 
             # get position values
             position = mock_mrglv1_manager.positions(token_id)
-            click.echo(f"Position status of tokenID {token_id}: {position}")
+            self.echo("Position status of tokenID %s: %s", token_id, position)
 
             # cache state before settling/liquidating to calculate net liquidity gained/lost by pool
-            pposition = mock_mrglv1_pool.positions(
-                get_mrglv1_position_key(mock_mrglv1_manager.address, position.positionId)
-            )
-            click.echo(f"Pool position status of tokenID {token_id}: {pposition}")
-            mrglv1_state_before = mock_mrglv1_pool.state()
-            click.echo(f"Marginal v1 state from last update: {mrglv1_state_before}")
+            pposition = mock_mrglv1_pool.positions(self._position_keys[i])
+            self.echo("Pool position status of tokenID %s: %s", token_id, pposition)
+            mrglv1_state_before = self.get_mrglv1_state()
+            self.echo("Marginal v1 state from last update: %s", mrglv1_state_before)
 
             # liquidate position if not safe
             if not position.safe:
-                click.echo(f"Liquidating position with tokenID {token_id} ...")
+                self.echo("Liquidating position with tokenID %s ...", token_id)
 
                 # liquidate the position
                 mock_mrglv1_pool.liquidate(
-                    self.acc.address, mock_mrglv1_manager.address, position.positionId, sender=self.acc
+                    self._addrs["acc"], self._addrs["mrglv1_manager"], position.positionId, sender=self.acc
                 )
 
                 # cache state after and calculate net liquidity gained/lost
-                mrglv1_state_after = mock_mrglv1_pool.state()
+                self._mrglv1_state = None
+                mrglv1_state_after = self.get_mrglv1_state()
                 liquidity_returned = mrglv1_state_after.liquidity - mrglv1_state_before.liquidity
                 net_liquidity = liquidity_returned - pposition.liquidityLocked
-                click.secho(
-                    f"Net liquidity gained by pool after liquidating: {net_liquidity}", blink=(net_liquidity < 0)
+                self.echo(
+                    "Net liquidity gained by pool after liquidating: %s", net_liquidity, blink=(net_liquidity < 0)
                 )
 
                 self._token_ids[i] = -1
+                self._position_keys[i] = None
                 self._positions_liquidated_cumulative[i] += 1
                 self._sizes_liquidated_cumulative[i] += position.size
                 self._net_liquidity_liquidated_cumulative[i] += net_liquidity
             # otherwise settle position if enough blocks have passed
             elif number >= self._blocks_settle[i]:
-                click.echo(f"Settling position with tokenID {token_id} ...")
+                self.echo("Settling position with tokenID %s ...", token_id)
 
                 # settle the position
                 burn_params = (
-                    mock_tokens[0],
-                    mock_tokens[1],
+                    self._addrs["token0"],
+                    self._addrs["token1"],
                     self.maintenance,
-                    mock_univ3_pool.address,
+                    self._addrs["univ3_pool"],
                     token_id,
-                    self.acc.address,
-                    2**256 - 1,
+                    self._addrs["acc"],
+                    MAX_UINT256,
                 )
                 mock_mrglv1_manager.burn(burn_params, sender=self.acc)
 
                 # cache state after and calculate net liquidity gained/lost
-                mrglv1_state_after = mock_mrglv1_pool.state()
+                self._mrglv1_state = None
+                mrglv1_state_after = self.get_mrglv1_state()
                 liquidity_returned = mrglv1_state_after.liquidity - mrglv1_state_before.liquidity
                 net_liquidity = liquidity_returned - pposition.liquidityLocked
-                click.secho(f"Net liquidity gained by pool after settling: {net_liquidity}", blink=(net_liquidity < 0))
+                self.echo("Net liquidity gained by pool after settling: %s", net_liquidity, blink=(net_liquidity < 0))
 
                 self._token_ids[i] = -1
+                self._position_keys[i] = None
                 self._positions_settled_cumulative[i] += 1
                 self._sizes_settled_cumulative[i] += position.size
                 self._net_liquidity_settled_cumulative[i] += net_liquidity
 
         # open any new positions if don't have existing long or short
-        for i, token_id in enumerate(self._token_ids.copy()):
+        liquidity_deltas = None  # calculated once from total liquidity before opening any positions
+        for i, token_id in enumerate(self._token_ids):
             if token_id != -1:
                 # position already there
                 continue
 
-            liquidity_delta = self.calculate_position_liquidity_deltas()[i]
-            mrglv1_state = mock_mrglv1_pool.state()
+            if liquidity_deltas is None:
+                liquidity_deltas = self.calculate_position_liquidity_deltas()
+
+            liquidity_delta = liquidity_deltas[i]
+            mrglv1_state = self.get_mrglv1_state()
             zero_for_one = i == 0
             size_desired = get_mrglv1_size_from_liquidity_delta(
                 mrglv1_state.liquidity,
@@ -631,38 +1132,38 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
                 zero_for_one,
                 self.maintenance,
             )
-            click.echo(f"New position liquidity delta: {liquidity_delta}")
-            click.echo(f"New position zeroForOne: {zero_for_one}")
-            click.echo(f"New position sizeDesired: {size_desired}")
+            self.echo("New position liquidity delta: %s", liquidity_delta)
+            self.echo("New position zeroForOne: %s", zero_for_one)
+            self.echo("New position sizeDesired: %s", size_desired)
             mint_params = (
-                mock_tokens[0].address,
-                mock_tokens[1].address,
+                self._addrs["token0"],
+                self._addrs["token1"],
                 self.maintenance,
-                mock_univ3_pool.address,
+                self._addrs["univ3_pool"],
                 zero_for_one,
                 size_desired,
                 0,
                 0,
                 0,
                 0,
-                2**128 - 1,  # to avoid below safe margin min reverts
-                self.acc.address,
-                2**256 - 1,
+                MAX_UINT128,  # to avoid below safe margin min reverts
+                self._addrs["acc"],
+                MAX_UINT256,
             )
             quote = mock_mrglv1_quoter.quoteMint(mint_params)
-            click.echo(f"Quote for opening new position: {quote}")
+            self.echo("Quote for opening new position: %s", quote)
 
             margin = (
                 int(size_desired / (self.leverage - 1))
                 if self.rel_margin_above_safe_min == 0
                 else int(quote.safeMarginMinimum * (1 + self.rel_margin_above_safe_min))
             )
-            click.echo(f"New position margin: {margin}")
+            self.echo("New position margin: %s", margin)
             mint_params = (
-                mock_tokens[0].address,
-                mock_tokens[1].address,
+                self._addrs["token0"],
+                self._addrs["token1"],
                 self.maintenance,
-                mock_univ3_pool.address,
+                self._addrs["univ3_pool"],
                 zero_for_one,
                 size_desired,
                 0,
@@ -670,16 +1171,20 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
                 0,
                 0,
                 margin,
-                self.acc.address,
-                2**256 - 1,
+                self._addrs["acc"],
+                MAX_UINT256,
             )
             receipt = mock_mrglv1_manager.mint(mint_params, sender=self.acc, value=int(1e18))  # excess ETH in case
-            next_token_id = receipt.decode_logs(mock_mrglv1_manager.Mint)[0].tokenId
-            next_position = mock_mrglv1_manager.positions(next_token_id)
+            self._mrglv1_state = None
+            mint_args = self.decode_log_args(receipt, mock_mrglv1_manager, "Mint", ["tokenId", "positionId"])
+            next_token_id = mint_args["tokenId"]
 
             self._token_ids[i] = next_token_id
+            self._position_keys[i] = get_mrglv1_position_key(self._addrs["mrglv1_manager"], mint_args["positionId"])
             self._blocks_settle[i] = number + self.blocks_held
-            click.echo(f"Opened new position with tokenID {next_token_id}: {next_position}")
+            if self.verbose:
+                next_position = mock_mrglv1_manager.positions(next_token_id)
+                self.echo("Opened new position with tokenID %s: %s", next_token_id, next_position)
 
             # estimate liquidity gains due to fees
             reserve0, reserve1 = get_mrglv1_amounts_for_liquidity(mrglv1_state.sqrtPriceX96, mrglv1_state.liquidity)
@@ -687,7 +1192,7 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
             fees1 = 0 if not zero_for_one else quote.fees
             liquidity_after, _ = get_mrglv1_liquidity_sqrt_price_x96_from_reserves(reserve0 + fees0, reserve1 + fees1)
             net_liquidity_open_fees = liquidity_after - mrglv1_state.liquidity
-            click.echo(f"Net liquidity gained from fees on opening position: {net_liquidity_open_fees}")
+            self.echo("Net liquidity gained from fees on opening position: %s", net_liquidity_open_fees)
             self._net_liquidity_position_fees_cumulative += net_liquidity_open_fees
 
         # simulate swaps for fee volume on mrgl v1
@@ -697,23 +1202,25 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
         self.arb_pools()
 
         # track outstanding position attributes
+        positions, ppositions = self.get_positions()
         (
             self._sizes_outstanding,
             self._margins_outstanding,
             self._debts_outstanding,
             self._debts_without_funding_outstanding,
             self._funding_rates_outstanding,
-        ) = self.get_positions_values()
-        self._amounts0_locked, self._amounts1_locked = self.get_positions_amounts_locked()
+        ) = self.get_positions_values(positions, ppositions)
+        self._amounts0_locked, self._amounts1_locked = self.get_positions_amounts_locked(ppositions)
 
         # track mock token balances in pool
-        self._balances_pool = [mock_token.balanceOf(mock_mrglv1_pool.address) for mock_token in mock_tokens]
+        self._balances_pool = self.get_balances_pool()
 
         # track mrgl v1 oracle state
-        mrglv1_state = mock_mrglv1_pool.state()
-        click.echo(f"Marginal v1 state after update: {mrglv1_state}")
+        mrglv1_state = self.get_mrglv1_state()
+        self.echo("Marginal v1 state after update: %s", mrglv1_state)
         self._last_mrglv1_block_timestamp = mrglv1_state.blockTimestamp
         self._last_mrglv1_tick_cumulative = mrglv1_state.tickCumulative
+        self.flush_echoes()
 
     def record(self, path: str, number: int, state: Mapping, values: List[int]):
         """
@@ -725,7 +1232,16 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
             state (Mapping): The state of references at block number.
             values (List[int]): The value of the backtester for the state.
         """
-        data = {"number": number, "timestamp": chain.blocks.head.timestamp}
+        # results file kept open through backtest once opened on first record
+        if self._record_file is None:
+            self._record_file = open(path, "w", buffering=self._record_buffering, newline="")
+            self._record_writer = None
+            self._record_rows = 0
+            self._record_row = {}
+
+        data = self._record_row
+        data["number"] = number
+        data["timestamp"] = chain.blocks.head.timestamp
         for i, value in enumerate(values):
             data[f"values{i}"] = value
 
@@ -741,37 +1257,23 @@ class MarginalV1LPRunner(BaseMarginalV1Runner):
         )
 
         # unfold if list
-        attr_names = [
-            "_token_ids",
-            "_blocks_settle",
-            "_sizes_outstanding",
-            "_margins_outstanding",
-            "_debts_outstanding",
-            "_debts_without_funding_outstanding",
-            "_funding_rates_outstanding",
-            "_amounts0_locked",
-            "_amounts1_locked",
-            "_positions_liquidated_cumulative",
-            "_positions_settled_cumulative",
-            "_sizes_liquidated_cumulative",
-            "_sizes_settled_cumulative",
-            "_net_liquidity_liquidated_cumulative",
-            "_net_liquidity_settled_cumulative",
-            "_balances_pool",
-            "_last_mrglv1_block_timestamp",
-            "_last_mrglv1_tick_cumulative",
-            "_net_liquidity_swap_fees_cumulative",
-            "_net_liquidity_position_fees_cumulative",
-        ]
-        for name in attr_names:
+        for name in self._record_attr_names:
             attr = getattr(self, name)
             if not isinstance(attr, list):
                 data[name] = attr
                 continue
 
-            for i, cum_val in enumerate(attr):
-                data[f"{name}{i}"] = cum_val
+            keys = self._record_attr_keys.get(name)
+            if keys is None:
+                keys = self._record_attr_keys[name] = [f"{name}{i}" for i in range(len(attr))]
+            data.update(zip(keys, attr))
+
+        # fields fixed after first record given number of backtester values
+        if self._record_writer is None:
+            self._record_writer = csv.DictWriter(self._record_file, fieldnames=list(data.keys()), extrasaction="ignore")
+            self._record_writer.writeheader()
 
-        header = not os.path.exists(path)
-        df = pd.DataFrame(data={k: [v] for k, v in data.items()})
-        df.to_csv(path, index=False, mode="a", header=header)
+        self._record_writer.writerow(data)
+        self._record_rows += 1
+        if self._record_rows % self._record_flush_every == 0:
+            self._record_file.flush()
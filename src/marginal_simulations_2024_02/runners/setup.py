@@ -66,8 +66,8 @@ def create_mock_mrglv1_pool(
     [token0, token1] = tokens
     univ3_fee = oracle.fee()
 
-    factory.createPool(token0.address, token1.address, maintenance, univ3_fee, sender=acc)
-    pool_addr = factory.getPool(token0.address, token1.address, maintenance, oracle.address)
+    receipt = factory.createPool(token0.address, token1.address, maintenance, univ3_fee, sender=acc)
+    pool_addr = receipt.decode_logs(factory.PoolCreated)[0].pool
     pool = project.MarginalV1Pool.at(pool_addr)
     return pool
 
@@ -1,29 +1,67 @@
-from eth_abi.packed import encode_packed
 from eth_utils import keccak
 
-from math import sqrt
+from math import isqrt
 
-from marginal_simulations_2024_02.constants import MAINTENANCE_UNIT
+from marginal_simulations_2024_02.constants import MAINTENANCE_UNIT, MAX_TICK, MAX_UINT256
 
 
 # common
+# @dev Q128 multipliers of 1/sqrt(1.0001)^(2^i) for bits i of abs tick, from uni v3 TickMath
+SQRT_RATIO_MULTIPLIERS = (
+    0xFFFCB933BD6FAD37AA2D162D1A594001,
+    0xFFF97272373D413259A46990580E213A,
+    0xFFF2E50F5F656932EF12357CF3C7FDCC,
+    0xFFE5CACA7E10E4E61C3624EAA0941CD0,
+    0xFFCB9843D60F6159C9DB58835C926644,
+    0xFF973B41FA98C081472E6896DFB254C0,
+    0xFF2EA16466C96A3843EC78B326B52861,
+    0xFE5DEE046A99A2A811C461F1969C3053,
+    0xFCBE86C7900A88AEDCFFC83B479AA3A4,
+    0xF987A7253AC413176F2B074CF7815E54,
+    0xF3392B0822B70005940C7A398E4B70F3,
+    0xE7159475A2C29B7443B29C7FA6E889D9,
+    0xD097F3BDFD2022B8845AD8F792AA5825,
+    0xA9F746462D870FDF8A65DC1F90E061E5,
+    0x70D869A156D2A1B890BB3DF62BAF32F7,
+    0x31BE135F97D08FD981231505542FCFA6,
+    0x9AA508B5B7A84E1C677DE54F3E99BC9,
+    0x5D6AF8DEDB81196699C329225EE604,
+    0x2216E584F5FA1EA926041BEDFE98,
+    0x48A170391F7DC42444E8FA2,
+)
+
+
 def get_sqrt_ratio_at_tick(tick: int) -> int:
-    return int(((1.0001 ** (tick)) ** (1 / 2)) * (1 << 96))
+    # @dev exact port of uni v3 TickMath.getSqrtRatioAtTick
+    abs_tick = tick if tick >= 0 else -tick
+    assert abs_tick <= MAX_TICK
+
+    ratio = SQRT_RATIO_MULTIPLIERS[0] if abs_tick & 0x1 != 0 else (1 << 128)
+    for i in range(1, len(SQRT_RATIO_MULTIPLIERS)):
+        if abs_tick & (1 << i) != 0:
+            ratio = (ratio * SQRT_RATIO_MULTIPLIERS[i]) >> 128
+
+    if tick > 0:
+        ratio = MAX_UINT256 // ratio
+
+    # round up from Q128 to Q96
+    return (ratio >> 32) + (0 if ratio % (1 << 32) == 0 else 1)
 
 
 # mrgl v1 utility functions
 def get_mrglv1_position_key(address: str, id: int) -> bytes:
-    return keccak(encode_packed(["address", "uint96"], [address, id]))
+    # @dev abi.encodePacked(address, uint96) is the 20 address bytes then 12 id bytes
+    return keccak(bytes.fromhex(address[2:]) + id.to_bytes(12, "big"))
 
 
 def get_mrglv1_amounts_for_liquidity(sqrt_price_x96: int, liquidity: int) -> (int, int):
     amount0 = (liquidity << 96) // sqrt_price_x96
-    amount1 = (liquidity * sqrt_price_x96) // (1 << 96)
+    amount1 = (liquidity * sqrt_price_x96) >> 96
     return (amount0, amount1)
 
 
 def get_mrglv1_liquidity_sqrt_price_x96_from_reserves(reserve0: int, reserve1: int) -> (int, int):
-    liquidity = int(sqrt(reserve0 * reserve1))
+    liquidity = isqrt(reserve0 * reserve1)
     sqrt_price_x96 = (liquidity << 96) // reserve0
     return (liquidity, sqrt_price_x96)
 
@@ -35,14 +73,15 @@ def get_mrglv1_sqrt_price_x96_next_open(
     zero_for_one: bool,
     maintenance: int,
 ) -> int:
-    prod = (liquidity_delta * (liquidity - liquidity_delta) * MAINTENANCE_UNIT) // (MAINTENANCE_UNIT + maintenance)
-    under = liquidity**2 - 4 * prod
-    root = int(sqrt(under))
+    liquidity_after = liquidity - liquidity_delta
+    prod = (liquidity_delta * liquidity_after * MAINTENANCE_UNIT) // (MAINTENANCE_UNIT + maintenance)
+    under = liquidity * liquidity - 4 * prod
+    root = isqrt(under)
 
     sqrt_price_x96_next = (
-        int(sqrt_price_x96 * (liquidity + root)) // (2 * (liquidity - liquidity_delta))
+        (sqrt_price_x96 * (liquidity + root)) // (2 * liquidity_after)
         if not zero_for_one
-        else int(sqrt_price_x96 * 2 * (liquidity - liquidity_delta)) // (liquidity + root)
+        else (sqrt_price_x96 * 2 * liquidity_after) // (liquidity + root)
     )
 
     return sqrt_price_x96_next
@@ -61,7 +100,7 @@ def get_mrglv1_insurances(
         else ((liquidity - liquidity_delta) * sqrt_price_x96) // sqrt_price_x96_next
     )
     insurance0 = ((liquidity - prod) << 96) // sqrt_price_x96
-    insurance1 = ((liquidity - prod) * sqrt_price_x96) // (1 << 96)
+    insurance1 = ((liquidity - prod) * sqrt_price_x96) >> 96
     return (insurance0, insurance1)
 
 
@@ -72,7 +111,7 @@ def get_mrglv1_debts(
     insurance1: int,
 ) -> (int, int):
     debt0 = (liquidity_delta << 96) // sqrt_price_x96_next - insurance0
-    debt1 = (liquidity_delta * sqrt_price_x96_next) // (1 << 96) - insurance1
+    debt1 = ((liquidity_delta * sqrt_price_x96_next) >> 96) - insurance1
     return (debt0, debt1)
 
 
@@ -85,67 +124,62 @@ def get_mrglv1_size_from_liquidity_delta(
 ) -> int:
     # sx = dy / sqrt(P * P') for zero_for_one = False
     # sy = dx * sqrt(P * P') for zero_for_one = True
-    sqrt_price_x96_next = get_mrglv1_sqrt_price_x96_next_open(
-        liquidity,
-        sqrt_price_x96,
-        liquidity_delta,
-        zero_for_one,
-        maintenance,
-    )
-    insurance0, insurance1 = get_mrglv1_insurances(
-        liquidity,
-        sqrt_price_x96,
-        sqrt_price_x96_next,
-        liquidity_delta,
-        zero_for_one,
-    )
-    debt0, debt1 = get_mrglv1_debts(
-        sqrt_price_x96_next,
-        liquidity_delta,
-        insurance0,
-        insurance1,
-    )
-    size = (
-        (debt1 * (1 << 192)) // (sqrt_price_x96_next * sqrt_price_x96)
-        if not zero_for_one
-        else (debt0 * (sqrt_price_x96_next * sqrt_price_x96)) // (1 << 192)
-    )
+    # @dev fuses get_mrglv1_sqrt_price_x96_next_open, get_mrglv1_insurances, get_mrglv1_debts
+    # only computing the insurance and debt on the side needed for size
+    liquidity_after = liquidity - liquidity_delta
+    prod_open = (liquidity_delta * liquidity_after * MAINTENANCE_UNIT) // (MAINTENANCE_UNIT + maintenance)
+    root = isqrt(liquidity * liquidity - 4 * prod_open)
+
+    if not zero_for_one:
+        sqrt_price_x96_next = (sqrt_price_x96 * (liquidity + root)) // (2 * liquidity_after)
+        prod = (liquidity_after * sqrt_price_x96_next) // sqrt_price_x96
+        insurance1 = ((liquidity - prod) * sqrt_price_x96) >> 96
+        debt1 = ((liquidity_delta * sqrt_price_x96_next) >> 96) - insurance1
+        size = (debt1 << 192) // (sqrt_price_x96_next * sqrt_price_x96)
+    else:
+        sqrt_price_x96_next = (sqrt_price_x96 * 2 * liquidity_after) // (liquidity + root)
+        prod = (liquidity_after * sqrt_price_x96) // sqrt_price_x96_next
+        insurance0 = ((liquidity - prod) << 96) // sqrt_price_x96
+        debt0 = (liquidity_delta << 96) // sqrt_price_x96_next - insurance0
+        size = (debt0 * (sqrt_price_x96_next * sqrt_price_x96)) >> 192
+
     return size
 
 
 # uni v3 utility functions
 def get_univ3_amount0_for_liquidity(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, liquidity: int) -> int:
-    return (((liquidity * (1 << 96)) * (sqrt_ratio_b_x96 - sqrt_ratio_a_x96)) // sqrt_ratio_b_x96) // sqrt_ratio_a_x96
+    return (((liquidity << 96) * (sqrt_ratio_b_x96 - sqrt_ratio_a_x96)) // sqrt_ratio_b_x96) // sqrt_ratio_a_x96
 
 
 def get_univ3_amount1_for_liquidity(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, liquidity: int) -> int:
-    return (liquidity * (sqrt_ratio_b_x96 - sqrt_ratio_a_x96)) // (1 << 96)
+    return (liquidity * (sqrt_ratio_b_x96 - sqrt_ratio_a_x96)) >> 96
 
 
 def get_univ3_amounts_for_liquidity(
     sqrt_ratio_x96: int, sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, liquidity: int
 ) -> (int, int):
     # @dev only implemented for tick_lower <= state.tick <= tick_upper
-    assert sqrt_ratio_a_x96 <= sqrt_ratio_x96 and sqrt_ratio_x96 <= sqrt_ratio_b_x96
-    amount0 = get_univ3_amount0_for_liquidity(sqrt_ratio_x96, sqrt_ratio_b_x96, liquidity)
-    amount1 = get_univ3_amount1_for_liquidity(sqrt_ratio_a_x96, sqrt_ratio_x96, liquidity)
+    assert sqrt_ratio_a_x96 <= sqrt_ratio_x96 <= sqrt_ratio_b_x96
+    # @dev inlines get_univ3_amount0_for_liquidity, get_univ3_amount1_for_liquidity
+    amount0 = (((liquidity << 96) * (sqrt_ratio_b_x96 - sqrt_ratio_x96)) // sqrt_ratio_b_x96) // sqrt_ratio_x96
+    amount1 = (liquidity * (sqrt_ratio_x96 - sqrt_ratio_a_x96)) >> 96
     return (amount0, amount1)
 
 
 def get_univ3_liquidity_for_amount0(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, amount0: int) -> int:
-    intermediate = (sqrt_ratio_a_x96 * sqrt_ratio_b_x96) // (1 << 96)
+    intermediate = (sqrt_ratio_a_x96 * sqrt_ratio_b_x96) >> 96
     return (amount0 * intermediate) // (sqrt_ratio_b_x96 - sqrt_ratio_a_x96)
 
 
 def get_univ3_liquidity_for_amount1(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, amount1: int) -> int:
-    return (amount1 * (1 << 96)) // (sqrt_ratio_b_x96 - sqrt_ratio_a_x96)
+    return (amount1 << 96) // (sqrt_ratio_b_x96 - sqrt_ratio_a_x96)
 
 
 def get_univ3_liquidity_for_amounts(
     sqrt_ratio_x96: int, sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, amount0: int, amount1: int
 ) -> int:
     # @dev only implemented for tick_lower <= state.tick <= tick_upper
-    assert sqrt_ratio_a_x96 <= sqrt_ratio_x96 and sqrt_ratio_x96 <= sqrt_ratio_b_x96
+    assert sqrt_ratio_a_x96 <= sqrt_ratio_x96 <= sqrt_ratio_b_x96
     liquidity0 = get_univ3_liquidity_for_amount0(sqrt_ratio_x96, sqrt_ratio_b_x96, amount0)
     liquidity1 = get_univ3_liquidity_for_amount1(sqrt_ratio_a_x96, sqrt_ratio_x96, amount1)
-    return liquidity0 if liquidity0 < liquidity1 else liquidity1
+    return min(liquidity0, liquidity1)
@@ -0,0 +1,68 @@
+import json
+import sqlite3
+
+from marginal_simulations_2024_02.cache import get_cached_refs_results, open_refs_cache, set_cached_refs_results
+
+
+CHAIN_ID = 1
+ADDRESS = "0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640"
+SECONDS_AGO = 3600
+RESULTS = {
+    100: ["0x01", "0x02", {"timestamp": "0x64"}],
+    101: ["0x03", "0x04", {"timestamp": "0x65"}],
+}
+
+
+def test_refs_cache_round_trip(tmp_path):
+    path = str(tmp_path / "results" / ".refs_cache.sqlite")
+    conn = open_refs_cache(path)
+    set_cached_refs_results(conn, CHAIN_ID, ADDRESS, RESULTS, SECONDS_AGO, max_number=200)
+    conn.close()
+
+    # persisted across connections
+    conn = open_refs_cache(path)
+    assert get_cached_refs_results(conn, CHAIN_ID, ADDRESS, [100, 101, 102], SECONDS_AGO, max_number=200) == RESULTS
+    assert get_cached_refs_results(conn, CHAIN_ID, ADDRESS, [], SECONDS_AGO, max_number=200) == {}
+    assert get_cached_refs_results(conn, CHAIN_ID, ADDRESS, [100], SECONDS_AGO + 1, max_number=200) == {}
+    conn.close()
+
+
+def test_refs_cache_keyed_by_chain_id(tmp_path):
+    conn = open_refs_cache(str(tmp_path / ".refs_cache.sqlite"))
+    set_cached_refs_results(conn, CHAIN_ID + 1, ADDRESS, RESULTS, SECONDS_AGO, max_number=200)
+    assert get_cached_refs_results(conn, CHAIN_ID, ADDRESS, [100, 101], SECONDS_AGO, max_number=200) == {}
+    assert get_cached_refs_results(conn, CHAIN_ID + 1, ADDRESS, [100, 101], SECONDS_AGO, max_number=200) == RESULTS
+    conn.close()
+
+
+def test_refs_cache_only_pre_fork_blocks(tmp_path):
+    conn = open_refs_cache(str(tmp_path / ".refs_cache.sqlite"))
+    set_cached_refs_results(conn, CHAIN_ID, ADDRESS, RESULTS, SECONDS_AGO, max_number=100)
+    rows = conn.execute("SELECT number FROM refs").fetchall()
+    assert rows == [(100,)]
+
+    # blocks past max number not looked up even if cached by an earlier fork
+    set_cached_refs_results(conn, CHAIN_ID, ADDRESS, RESULTS, SECONDS_AGO, max_number=200)
+    assert get_cached_refs_results(conn, CHAIN_ID, ADDRESS, [100, 101], SECONDS_AGO, max_number=100) == {
+        100: RESULTS[100]
+    }
+    assert get_cached_refs_results(conn, CHAIN_ID, ADDRESS, [100, 101], SECONDS_AGO, max_number=-1) == {}
+    conn.close()
+
+
+def test_refs_cache_drops_legacy_table(tmp_path):
+    path = str(tmp_path / ".refs_cache.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE refs (address TEXT, number INTEGER, seconds_ago INTEGER, results TEXT, "
+        "PRIMARY KEY (address, number, seconds_ago))"
+    )
+    conn.execute("INSERT INTO refs VALUES (?, ?, ?, ?)", (ADDRESS, 100, SECONDS_AGO, json.dumps(RESULTS[100])))
+    conn.commit()
+    conn.close()
+
+    conn = open_refs_cache(path)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(refs)")]
+    assert columns == ["chain_id", "address", "number", "seconds_ago", "results"]
+    assert conn.execute("SELECT COUNT(*) FROM refs").fetchone() == (0,)
+    conn.close()
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+from ape import networks
+from eth_abi import encode
+from eth_utils import keccak
+from ethpm_types.abi import EventABI
+from hexbytes import HexBytes
+
+from marginal_simulations_2024_02.runners import MarginalV1LPRunner
+
+
+MINT_ABI = EventABI.parse_obj(
+    {
+        "type": "event",
+        "name": "Mint",
+        "anonymous": False,
+        "inputs": [
+            {"name": "tokenId", "type": "uint256", "indexed": True},
+            {"name": "sender", "type": "address", "indexed": False},
+            {"name": "recipient", "type": "address", "indexed": True},
+            {"name": "positionId", "type": "uint256", "indexed": False},
+            {"name": "size", "type": "uint256", "indexed": False},
+            {"name": "debt", "type": "uint256", "indexed": False},
+            {"name": "margin", "type": "uint256", "indexed": False},
+            {"name": "fees", "type": "uint256", "indexed": False},
+            {"name": "rewards", "type": "uint256", "indexed": False},
+        ],
+    }
+)
+MANAGER = "0x5FbDB2315678afecb367f032d93F642f64180aa3"
+SENDER = "0x70997970C51812dc3A010C7d01b50e0d17dc79C8"
+
+
+def mint_log(token_id: int, position_id: int, log_index: int) -> dict:
+    return {
+        "address": MANAGER,
+        "topics": [
+            HexBytes(keccak(text=MINT_ABI.selector)),
+            HexBytes(encode(["uint256"], [token_id])),
+            HexBytes(encode(["address"], [SENDER])),
+        ],
+        "data": HexBytes(
+            encode(
+                ["address", "uint256", "uint256", "uint256", "uint256", "uint256", "uint256"],
+                [SENDER, position_id, 10**18, 2 * 10**18, 5 * 10**17, 3 * 10**15, 10**15],
+            )
+        ),
+        "blockHash": HexBytes(b"\x01" * 32),
+        "blockNumber": 17998181,
+        "logIndex": log_index,
+        "transactionHash": HexBytes(b"\x02" * 32),
+        "transactionIndex": 0,
+    }
+
+
+def test_decode_log_args_matches_ape():
+    runner = SimpleNamespace(_event_templates={})
+    manager = SimpleNamespace(address=MANAGER, Mint=SimpleNamespace(abi=MINT_ABI))
+    logs = [mint_log(7, 3, 0), mint_log(8, 4, 1)]
+    receipt = SimpleNamespace(logs=logs)
+
+    for index, log in enumerate(networks.ethereum.decode_logs(logs, MINT_ABI)):
+        args = MarginalV1LPRunner.decode_log_args(
+            runner, receipt, manager, "Mint", ["tokenId", "positionId"], index=index
+        )
+        assert args == {
+            "tokenId": log.event_arguments["tokenId"],
+            "positionId": log.event_arguments["positionId"],
+        }
+        assert args["tokenId"] == 7 + index and args["positionId"] == 3 + index
+
+    assert runner._event_templates[(MANAGER, "Mint")][0] == keccak(text=MINT_ABI.selector)
@@ -0,0 +1,113 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from ape.exceptions import ProviderError
+from eth_abi import encode
+from ethpm_types.abi import MethodABI
+from web3 import HTTPProvider
+
+from marginal_simulations_2024_02 import rpc
+
+
+BALANCE_OF_ABI = MethodABI.parse_obj(
+    {
+        "type": "function",
+        "name": "balanceOf",
+        "stateMutability": "view",
+        "inputs": [{"name": "account", "type": "address"}],
+        "outputs": [{"name": "", "type": "uint256"}],
+    }
+)
+ACCOUNT = "0x000000000000000000000000000000000000dEaD"
+
+
+class MockResponse:
+    def __init__(self, body):
+        self.content = json.dumps(body).encode()
+
+    def raise_for_status(self):
+        pass
+
+
+class MockSession:
+    def __init__(self, responder):
+        self.responder = responder
+        self.payloads = []
+
+    def post(self, uri, data, headers, timeout):
+        payload = json.loads(data)
+        self.payloads.append(payload)
+        return MockResponse(self.responder(payload))
+
+
+def mock_provider(monkeypatch, web3_provider, make_request=None):
+    provider = SimpleNamespace(web3=SimpleNamespace(provider=web3_provider), _make_request=make_request)
+    monkeypatch.setattr(rpc, "chain", SimpleNamespace(provider=provider))
+
+
+def mock_session(monkeypatch, responder) -> MockSession:
+    mock_provider(monkeypatch, HTTPProvider("http://127.0.0.1:8545"))
+    session = MockSession(responder)
+    monkeypatch.setattr(rpc, "get_session", lambda: session)
+    return session
+
+
+def test_encode_calldata():
+    data = rpc.encode_calldata(BALANCE_OF_ABI, ACCOUNT)
+    assert data == bytes.fromhex("70a08231") + encode(["address"], [ACCOUNT])
+    assert rpc._method_templates["balanceOf(address)"] == (bytes.fromhex("70a08231"), ["address"])
+
+    # cached template reused for subsequent encodes
+    assert rpc.encode_calldata(BALANCE_OF_ABI, ACCOUNT) == data
+
+
+def test_make_batch_request_maps_results_by_id(monkeypatch):
+    session = mock_session(
+        monkeypatch,
+        lambda payload: [{"jsonrpc": "2.0", "id": req["id"], "result": req["method"]} for req in reversed(payload)],
+    )
+    calls = [(f"method{i}", []) for i in range(5)]
+    assert rpc.make_batch_request(calls, batch_size=2) == [f"method{i}" for i in range(5)]
+    assert [len(payload) for payload in session.payloads] == [2, 2, 1]
+
+
+def test_make_batch_request_passes_through_request_errors(monkeypatch):
+    mock_session(
+        monkeypatch,
+        lambda payload: [
+            {"jsonrpc": "2.0", "id": 0, "result": "0x01"},
+            {"jsonrpc": "2.0", "id": 1, "error": {"code": 3, "message": "execution reverted"}},
+        ],
+    )
+    results = rpc.make_batch_request([("eth_call", []), ("eth_call", [])])
+    assert results[0] == "0x01"
+    assert isinstance(results[1], ProviderError)
+    assert str(results[1]) == "execution reverted"
+
+
+def test_make_batch_request_raises_on_missing_id(monkeypatch):
+    mock_session(monkeypatch, lambda payload: [{"jsonrpc": "2.0", "id": 1, "result": "0x02"}])
+    with pytest.raises(ProviderError, match="missing result for request id 0"):
+        rpc.make_batch_request([("eth_call", []), ("eth_call", [])])
+
+
+def test_make_batch_request_raises_on_batch_error(monkeypatch):
+    mock_session(
+        monkeypatch,
+        lambda payload: {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "batch too large"}},
+    )
+    with pytest.raises(ProviderError, match="batch too large"):
+        rpc.make_batch_request([("eth_call", [])])
+
+
+def test_make_batch_request_falls_back_without_http_provider(monkeypatch):
+    def make_request(method, params):
+        if method == "eth_call":
+            raise ProviderError("execution reverted")
+        return method
+
+    mock_provider(monkeypatch, object(), make_request)
+    results = rpc.make_batch_request([("eth_blockNumber", []), ("eth_call", [])])
+    assert results[0] == "eth_blockNumber"
+    assert isinstance(results[1], ProviderError)
@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from marginal_simulations_2024_02.constants import MAX_TICK, MIN_TICK
+from marginal_simulations_2024_02.utils import (
+    get_mrglv1_debts,
+    get_mrglv1_insurances,
+    get_mrglv1_size_from_liquidity_delta,
+    get_mrglv1_sqrt_price_x96_next_open,
+    get_sqrt_ratio_at_tick,
+)
+
+
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+
+
+@pytest.mark.parametrize(
+    "tick,sqrt_ratio_x96",
+    [
+        (MIN_TICK, MIN_SQRT_RATIO),
+        (0, 1 << 96),
+        (MAX_TICK, MAX_SQRT_RATIO),
+    ],
+)
+def test_get_sqrt_ratio_at_tick(tick, sqrt_ratio_x96):
+    assert get_sqrt_ratio_at_tick(tick) == sqrt_ratio_x96
+
+
+@pytest.mark.parametrize("tick", [MIN_TICK - 1, MAX_TICK + 1])
+def test_get_sqrt_ratio_at_tick_reverts_out_of_range(tick):
+    with pytest.raises(AssertionError):
+        get_sqrt_ratio_at_tick(tick)
+
+
+def get_mrglv1_size_from_liquidity_delta_unfused(
+    liquidity: int,
+    sqrt_price_x96: int,
+    liquidity_delta: int,
+    zero_for_one: bool,
+    maintenance: int,
+) -> int:
+    sqrt_price_x96_next = get_mrglv1_sqrt_price_x96_next_open(
+        liquidity,
+        sqrt_price_x96,
+        liquidity_delta,
+        zero_for_one,
+        maintenance,
+    )
+    insurance0, insurance1 = get_mrglv1_insurances(
+        liquidity,
+        sqrt_price_x96,
+        sqrt_price_x96_next,
+        liquidity_delta,
+        zero_for_one,
+    )
+    debt0, debt1 = get_mrglv1_debts(
+        sqrt_price_x96_next,
+        liquidity_delta,
+        insurance0,
+        insurance1,
+    )
+    return (
+        (debt1 << 192) // (sqrt_price_x96_next * sqrt_price_x96)
+        if not zero_for_one
+        else (debt0 * (sqrt_price_x96_next * sqrt_price_x96)) >> 192
+    )
+
+
+def test_get_mrglv1_size_from_liquidity_delta_matches_unfused():
+    rng = random.Random(0)
+    for _ in range(20000):
+        liquidity = rng.randrange(2, 1 << 128)
+        sqrt_price_x96 = rng.randrange(MIN_SQRT_RATIO, MAX_SQRT_RATIO)
+        liquidity_delta = rng.randrange(1, liquidity)
+        zero_for_one = rng.random() < 0.5
+        maintenance = rng.choice([250000, 500000, 1000000])
+
+        args = (liquidity, sqrt_price_x96, liquidity_delta, zero_for_one, maintenance)
+        assert get_mrglv1_size_from_liquidity_delta(*args) == get_mrglv1_size_from_liquidity_delta_unfused(*args)